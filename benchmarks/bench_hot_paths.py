@@ -0,0 +1,276 @@
+"""Micro-benchmarks for the code paths whose cost grows with data size.
+
+Each benchmark runs over increasing input sizes and prints the time, the
+time per item and the scaling exponent against the previous size (1.0 is
+linear, 2.0 quadratic), next to the pre-refactor implementation where
+there is one:
+
+  normalize       device Attendance -> punch (legacy dict with f-string and
+                  strftime vs punches.Punch.from_attendance)
+  daily_file      merging a cycle's punches into the day's file (legacy JSON
+                  rewrite with dict dedup vs punch_journal.PunchJournal)
+  new_logs        selecting the new punches of a cycle (legacy list
+                  membership vs punches.select_new_logs)
+  recent_errors   biometric_attendance_sync.get_recent_errors on a growing
+                  error log
+  running_status  gui.py get_running_status log scan on growing logs
+
+    python benchmarks/bench_hot_paths.py
+    python benchmarks/bench_hot_paths.py --only normalize new_logs --sizes 1000 10000 100000 --output hot_paths.json
+"""
+import argparse
+import collections
+import datetime
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_new_records import LEGACY_SCAN_LIMIT, legacy_scan, make_day
+from bench_sync import BASE_CONFIG
+from punch_journal import PunchJournal
+from punches import Punch, select_new_logs
+
+Attendance = collections.namedtuple('Attendance', 'user_id timestamp status punch uid')
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def timed(fn, setup=None, repeat=3):
+    """Best wall time of fn(*setup()) over `repeat` runs (setup is not timed)."""
+    best = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        started = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def make_attendances(size, offset=0):
+    start = datetime.datetime(2025, 1, 29, 6, 0, 0) + datetime.timedelta(seconds=offset * 3)
+    return [
+        Attendance(str(i % 2000 + 1), start + datetime.timedelta(seconds=i * 3), 1, 0, i % 2000 + 1)
+        for i in range(size)
+    ]
+
+
+def legacy_normalize(logs):
+    filtered_logs = []
+    for log in logs:
+        punch_time = log.timestamp
+        punch_hour = punch_time.hour
+        punch_direction = 'IN' if 8 <= punch_hour < 17 else 'OUT'
+        filtered_logs.append({
+            'user_id': f"T{int(log.user_id):06d}",
+            'timestamp': punch_time.strftime(LOG_TIME_FORMAT),
+            'punch_direction': punch_direction,
+            'log_type': punch_direction
+        })
+    return filtered_logs
+
+
+def punch_normalize(logs):
+    return [Punch.from_attendance(log, 'device_1') for log in logs]
+
+
+def bench_normalize(size, workdir):
+    logs = make_attendances(size)
+    return {'legacy': timed(legacy_normalize, lambda: (logs,)), 'current': timed(punch_normalize, lambda: (logs,))}
+
+
+def legacy_merge(output_file, new_logs):
+    data_to_export = list(new_logs)
+    if os.path.exists(output_file):
+        with open(output_file, 'r') as f:
+            existing_data = json.load(f)
+        data_to_export = existing_data + data_to_export
+    unique_data = {f"{log['user_id']}_{log['timestamp']}": log for log in data_to_export}
+    data_to_export = list(unique_data.values())
+    with open(output_file, 'w') as f:
+        json.dump(data_to_export, f, indent=4)
+
+
+def journal_merge(directory, new_punches):
+    journal = PunchJournal(directory, '2025-01-29')
+    journal.load()
+    journal.append(new_punches)
+
+
+def bench_daily_file(size, workdir):
+    """A day's file already holding `size` punches gets one more cycle (1%)."""
+    batch = max(size // 100, 1)
+    day = make_attendances(size)
+    legacy_file = os.path.join(workdir, 'legacy.json')
+    journal_dir = os.path.join(workdir, 'journal')
+    shutil.rmtree(journal_dir, ignore_errors=True)
+    os.makedirs(journal_dir)
+    with open(legacy_file, 'w') as f:
+        json.dump(legacy_normalize(day), f, indent=4)
+    PunchJournal(journal_dir, '2025-01-29').append(punch_normalize(day))
+    cycles = iter(range(1, 1000))
+
+    def new_legacy():
+        return legacy_file, legacy_normalize(make_attendances(batch, offset=size * next(cycles)))
+
+    def new_journal():
+        return journal_dir, punch_normalize(make_attendances(batch, offset=size * next(cycles)))
+
+    return {'legacy': timed(legacy_merge, new_legacy), 'current': timed(journal_merge, new_journal)}
+
+
+def bench_new_logs(size, workdir):
+    punches = make_day(size, 10)
+    results = {'current': timed(select_new_logs, lambda: (punches,))}
+    if size <= LEGACY_SCAN_LIMIT:
+        logs = [punch.to_dict() for punch in punches]
+        results['legacy'] = timed(legacy_scan, lambda: (logs, logs), repeat=1)
+    return results
+
+
+def write_log(path, lines, start):
+    with open(path, 'w') as f:
+        for i in range(lines):
+            moment = start + datetime.timedelta(seconds=i)
+            f.write(f"{moment.strftime(LOG_TIME_FORMAT)},{i % 1000:03d} - Error fetching data from device 192.168.0.{i % 250}: timed out\n")
+
+
+def bench_recent_errors(size, workdir, sync):
+    error_log = os.path.join(sync.local_config.LOGS_DIRECTORY, f"{datetime.datetime.now().strftime('%d-%m-%Y')}__biometric_error_logger.log")
+    write_log(error_log, size, datetime.datetime(2025, 1, 29, 0, 0, 0))
+    return {'current': timed(sync.get_recent_errors)}
+
+
+def legacy_running_status(logs_directory, service_start_time):
+    """The log scan of gui.py get_running_status, for when PyQt5 is missing."""
+    def convert_into_date(datestring, pattern):
+        try:
+            return datetime.datetime.strptime(datestring, pattern)
+        except ValueError:
+            return None
+
+    def read_file_contents(file_name, index):
+        with open(os.path.join(logs_directory, f'{file_name}.log'), 'r') as file_handler:
+            return [line for idx, line in enumerate(file_handler, 1) if idx >= index]
+
+    running_status = []
+    with open(os.path.join(logs_directory, 'logs.log'), 'r') as f:
+        index = 0
+        for idx, line in enumerate(f, 1):
+            logdate = convert_into_date(line.split(',')[0], LOG_TIME_FORMAT)
+            if logdate and logdate >= convert_into_date(service_start_time.split('.')[0], LOG_TIME_FORMAT):
+                index = idx
+                break
+        if index:
+            running_status.extend(read_file_contents('logs', index))
+    with open(os.path.join(logs_directory, 'error.log'), 'r') as fread:
+        error_index = 0
+        for error_idx, error_line in enumerate(fread, 1):
+            start_date = convert_into_date(service_start_time.split('.')[0], LOG_TIME_FORMAT)
+            if start_date and start_date.strftime('%Y-%m-%d') in error_line:
+                error_logdate = convert_into_date(error_line.split(',')[0], LOG_TIME_FORMAT)
+                if error_logdate and error_logdate >= start_date:
+                    error_index = error_idx
+                    break
+        if error_index:
+            running_status.extend(read_file_contents('error', error_index))
+    return running_status
+
+
+def gui_running_status():
+    """Return a callable (logs_directory, start_time) running the real gui.py
+    get_running_status, or None when gui.py cannot be imported."""
+    try:
+        import gui
+    except ImportError:
+        return None
+    window = types.SimpleNamespace()
+    gui.create_message_box = lambda *args, **kwargs: None
+
+    def run(logs_directory, service_start_time):
+        window.service_start_time = types.SimpleNamespace(text=lambda: service_start_time)
+        return gui.MainWindow.get_running_status(window)
+    return run
+
+
+def bench_running_status(size, workdir, sync):
+    """logs.log and error.log of `size` lines each; the service started halfway."""
+    logs_directory = sync.local_config.LOGS_DIRECTORY
+    start = datetime.datetime(2025, 1, 29, 0, 0, 0)
+    for name in ('logs', 'error'):
+        write_log(os.path.join(logs_directory, f'{name}.log'), size, start)
+    service_start_time = (start + datetime.timedelta(seconds=size // 2)).strftime(LOG_TIME_FORMAT) + '.000000'
+    scan = gui_running_status() or legacy_running_status
+    return {'current': timed(scan, lambda: (logs_directory, service_start_time))}
+
+
+def load_sync(workdir):
+    """Import biometric_attendance_sync against a throwaway local_config."""
+    logs = os.path.join(workdir, 'logs')
+    os.makedirs(logs, exist_ok=True)
+    local_config = types.ModuleType('local_config')
+    local_config.__dict__.update(BASE_CONFIG)
+    local_config.__dict__.update({'ERPNEXT_URL': 'http://127.0.0.1:9', 'LOGS_DIRECTORY': logs, 'devices': []})
+    sys.modules['local_config'] = local_config
+    os.chdir(workdir)
+    import biometric_attendance_sync
+    biometric_attendance_sync.local_config = local_config
+    return biometric_attendance_sync
+
+
+BENCHMARKS = {
+    'normalize': bench_normalize,
+    'daily_file': bench_daily_file,
+    'new_logs': bench_new_logs,
+    'recent_errors': bench_recent_errors,
+    'running_status': bench_running_status,
+}
+NEEDS_SYNC = ('recent_errors', 'running_status')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_hot_paths_')
+    cwd = os.getcwd()
+    results = {}
+    try:
+        sync = load_sync(workdir) if any(name in NEEDS_SYNC for name in args.only) else None
+        for name in args.only:
+            print(f"\n{name}")
+            print(f"{'size':>10} {'impl':>8} {'ms':>10} {'ns/item':>10} {'scaling':>8}")
+            rows = results[name] = []
+            previous = {}
+            for size in sorted(args.sizes):
+                extra = (sync,) if name in NEEDS_SYNC else ()
+                for impl, seconds in sorted(BENCHMARKS[name](size, workdir, *extra).items()):
+                    scaling = None
+                    if impl in previous:
+                        last_size, last_seconds = previous[impl]
+                        scaling = math.log(seconds / last_seconds) / math.log(size / last_size) if last_seconds else None
+                    previous[impl] = (size, seconds)
+                    rows.append({'size': size, 'impl': impl, 'seconds': seconds, 'scaling': scaling})
+                    scaling_text = f"{scaling:8.2f}" if scaling is not None else f"{'':>8}"
+                    print(f"{size:>10} {impl:>8} {seconds * 1000:10.2f} {seconds / size * 1e9:10.0f} {scaling_text}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': datetime.datetime.now().isoformat(timespec='seconds'), 'sizes': args.sizes, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
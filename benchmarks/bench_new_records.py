@@ -0,0 +1,66 @@
+"""Benchmark new-record detection across all devices of a cycle.
+
+Compares the old list-membership filter over punch dicts (O(n*m)) with
+the hash-set based punches.select_new_logs on synthetic days of
+increasing size:
+
+    python benchmarks/bench_new_records.py
+    python benchmarks/bench_new_records.py --sizes 1000 10000 100000 --devices 10
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from punches import Direction, Punch, select_new_logs, to_epoch
+
+LEGACY_SCAN_LIMIT = 10_000
+
+
+def make_day(size, devices):
+    start = to_epoch(datetime.datetime(2025, 1, 29, 6, 0, 0))
+    punches = []
+    for i in range(size):
+        timestamp = start + i * 3
+        direction = Direction.for_hour(timestamp // 3600 % 24)
+        punches.append(Punch(f"T{i % 2000:06d}", timestamp, f"device_{i % devices}", direction))
+    return punches
+
+
+def legacy_scan(data_to_export, filtered_logs):
+    return [log for log in data_to_export if log in filtered_logs]
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 5_000, 10_000, 50_000, 100_000])
+    parser.add_argument('--devices', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'hash set (ms)':>14} {'ns/record':>10} {'list scan (ms)':>15}")
+    for size in args.sizes:
+        punches = make_day(size, args.devices)
+        hashed = timed(select_new_logs, punches)
+        if size <= LEGACY_SCAN_LIMIT:
+            logs = [punch.to_dict() for punch in punches]
+            legacy = f"{timed(legacy_scan, logs, logs, repeat=1) * 1000:15.1f}"
+        else:
+            legacy = f"{'skipped':>15}"
+        print(f"{size:>10} {hashed * 1000:14.2f} {hashed / size * 1e9:10.0f} {legacy}")
+
+
+if __name__ == '__main__':
+    main()
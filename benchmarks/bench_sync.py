@@ -0,0 +1,325 @@
+"""End-to-end benchmark of sync cycles against simulated devices and ERPNext.
+
+For every combination of --devices and --punches, starts that many
+zk_simulator terminals holding the punches between them and an
+erpnext_mock server, then runs the real biometric_attendance_sync cycle
+in a fresh child process (local_config is injected through sys.modules),
+so peak RSS is the sync's own. Each scenario runs --cycles cycles: the
+first finds every punch new, later ones measure an idle cycle.
+
+    python benchmarks/bench_sync.py
+    python benchmarks/bench_sync.py --devices 10 50 200 --punches 1000 50000 --output results.json
+    python benchmarks/bench_sync.py --device-latency 0.01 --erpnext-latency '*=lognormal:-4,0.5' --set CHECKIN_BATCH_SIZE=1
+
+Per cycle the report holds the wall time, time per stage (fetch,
+normalize, dedupe, status_check, push, file_write, outbox), punches/sec,
+HTTP calls per punch by endpoint and the peak RSS. fetch and normalize run
+on the fetch workers, so their times are summed over threads; fetch_wall
+is the span from the first device read starting to the last one ending.
+"""
+import argparse
+import ast
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.request
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+BASE_CONFIG = {
+    'ERPNEXT_API_KEY': 'bench',
+    'ERPNEXT_API_SECRET': 'bench',
+    'ERPNEXT_VERSION': 14,
+    'PULL_FREQUENCY': 1,
+    'IMPORT_START_DATE': None,
+    'EMAIL_SENDER': 'bench@localhost',
+    'EMAIL_RECEIVER': 'bench@localhost',
+    'SMTP_SERVER': 'localhost',
+    'SMTP_PORT': 25,
+    'SMTP_USER': '',
+    'SMTP_PASSWORD': '',
+    'shift_type_device_mapping': [],
+}
+
+
+class StageTimer:
+    """Accumulates the time spent inside instrumented functions per stage."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.spans = {}
+
+    def add(self, stage, started, ended):
+        with self.lock:
+            self.totals[stage] += ended - started
+            self.calls[stage] += 1
+            first, last = self.spans.get(stage, (started, ended))
+            self.spans[stage] = (min(first, started), max(last, ended))
+
+    def wrap(self, stage, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, started, time.perf_counter())
+        return timed
+
+    def wrap_iter(self, stage, fn):
+        """Time a generator function by the time spent producing its items."""
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            iterator = iter(fn(*args, **kwargs))
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self.add(stage, started, time.perf_counter())
+                    return
+                self.add(stage, started, time.perf_counter())
+                yield item
+        return timed
+
+    def report(self):
+        stages = dict(self.totals)
+        # _fetch_device_report wraps the device read and the Punch conversion
+        stages['normalize'] = stages.pop('fetch_report', 0.0) - stages.get('fetch', 0.0)
+        fetch_span = self.spans.get('fetch')
+        stages['fetch_wall'] = fetch_span[1] - fetch_span[0] if fetch_span else 0.0
+        return {stage: round(seconds, 6) for stage, seconds in sorted(stages.items())}
+
+
+def instrument(sync, timer):
+    sync.get_all_attendance_from_device = timer.wrap('fetch', sync.get_all_attendance_from_device)
+    sync._fetch_device_report = timer.wrap('fetch_report', sync._fetch_device_report)
+    sync.iter_new_punches = timer.wrap_iter('dedupe', sync.iter_new_punches)
+    sync.fetch_existing_checkin_keys = timer.wrap('dedupe', sync.fetch_existing_checkin_keys)
+    sync.employee_cache.prefetch = timer.wrap('status_check', sync.employee_cache.prefetch)
+    sync.employee_cache.get_status = timer.wrap('status_check', sync.employee_cache.get_status)
+    sync.push_concurrently = timer.wrap('push', sync.push_concurrently)
+    sync.PunchJournal.append = timer.wrap('file_write', sync.PunchJournal.append)
+    sync.update_device_cursor = timer.wrap('file_write', sync.update_device_cursor)
+    sync.update_last_sync_time = timer.wrap('file_write', sync.update_last_sync_time)
+    sync.employee_cache.save = timer.wrap('file_write', sync.employee_cache.save)
+    sync.outbox.add = timer.wrap('outbox', sync.outbox.add)
+    sync.outbox.mark = timer.wrap('outbox', sync.outbox.mark)
+
+
+def erpnext_stats(url):
+    with urllib.request.urlopen(f"{url}/__stats") as response:
+        return json.load(response)
+
+
+def request_counts(before, after):
+    counts = {}
+    for endpoint, statuses in after['requests'].items():
+        for status, count in statuses.items():
+            delta = count - before['requests'].get(endpoint, {}).get(status, 0)
+            if delta:
+                counts.setdefault(endpoint, {})[status] = delta
+    return counts
+
+
+def run_child(config_path):
+    """Run the sync cycles of one scenario (in its own process)."""
+    with open(config_path) as f:
+        config = json.load(f)
+    os.chdir(config['workdir'])
+    local_config = types.ModuleType('local_config')
+    local_config.__dict__.update(BASE_CONFIG)
+    local_config.__dict__.update(config['local_config'])
+    sys.modules['local_config'] = local_config
+    sys.path.insert(0, REPO_DIR)
+
+    started = time.perf_counter()
+    import biometric_attendance_sync as sync
+    import_seconds = time.perf_counter() - started
+
+    timer = StageTimer()
+    instrument(sync, timer)
+    since = datetime.datetime(2000, 1, 1)
+    cycles = []
+    for cycle in range(1, config['cycles'] + 1):
+        timer.reset()
+        outbox_before = sync.outbox.counts()
+        http_before = erpnext_stats(config['erpnext_url'])
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sync.run_sync_cycle(since)
+        wall = time.perf_counter() - started
+        outbox_after = sync.outbox.counts()
+        requests = request_counts(http_before, erpnext_stats(config['erpnext_url']))
+        outcomes = {state: outbox_after.get(state, 0) - outbox_before.get(state, 0) for state in outbox_after}
+        queued = sum(outcomes.values())
+        delivered = outcomes.get('sent', 0) + outcomes.get('duplicate', 0) + outcomes.get('inactive', 0)
+        http_calls = sum(sum(statuses.values()) for statuses in requests.values())
+        cycles.append({
+            'cycle': cycle,
+            'wall_seconds': round(wall, 6),
+            'punches_queued': queued,
+            'punches_settled': delivered,
+            'outcomes': outcomes,
+            'punches_per_second': round(delivered / wall, 1) if wall else None,
+            'http_calls': http_calls,
+            'http_calls_per_punch': round(http_calls / delivered, 4) if delivered else None,
+            'http_requests': requests,
+            'stages': timer.report(),
+        })
+    sync.zk_connections.close_all()
+    sync.outbox.close()
+    sync.erpnext.close()
+    result = {
+        'import_seconds': round(import_seconds, 6),
+        'cycles': cycles,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    with open(config['output'], 'w') as f:
+        json.dump(result, f)
+
+
+def run_scenario(devices, punches, args, mock, overrides):
+    from zk_simulator import ZKSimulator
+
+    per_device, extra = divmod(punches, devices)
+    simulators = [
+        ZKSimulator(
+            users=args.users, records=per_device + (index < extra), latency=args.device_latency,
+            loss=args.device_loss, crash_rate=args.device_crash_rate, seed=index
+        ).start()
+        for index in range(devices)
+    ]
+    workdir = tempfile.mkdtemp(prefix='bench_sync_')
+    logs = os.path.join(workdir, 'logs')
+    os.makedirs(logs)
+    local_config = {
+        'ERPNEXT_URL': mock.url,
+        'LOGS_DIRECTORY': logs,
+        'devices': [
+            {'device_id': f"sim_{index + 1}", 'ip': '127.0.0.1', 'port': simulator.port, 'ommit_ping': True,
+             'force_udp': args.udp, 'punch_direction': None, 'clear_from_device_on_fetch': False}
+            for index, simulator in enumerate(simulators)
+        ],
+    }
+    local_config.update(overrides)
+    config = {
+        'workdir': workdir,
+        'erpnext_url': mock.url,
+        'cycles': args.cycles,
+        'output': os.path.join(workdir, 'result.json'),
+        'local_config': local_config,
+    }
+    config_path = os.path.join(workdir, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+    try:
+        mock.reset()
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', config_path], check=True, stdout=subprocess.DEVNULL)
+        with open(config['output']) as f:
+            result = json.load(f)
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'devices': devices, 'punches': punches, **result}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_overrides(values):
+    overrides = {}
+    for value in values or []:
+        key, _, setting = value.partition('=')
+        try:
+            overrides[key] = ast.literal_eval(setting)
+        except (ValueError, SyntaxError):
+            overrides[key] = setting
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full sync cycles against simulated devices and ERPNext.")
+    parser.add_argument('--devices', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--punches', type=int, nargs='+', default=[1000, 10000], help="punches stored across all devices")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--udp', action='store_true', help="talk to the simulated devices over UDP")
+    parser.add_argument('--device-latency', type=float, default=0.0, help="seconds added to every device reply")
+    parser.add_argument('--device-loss', type=float, default=0.0)
+    parser.add_argument('--device-crash-rate', type=float, default=0.0)
+    parser.add_argument('--erpnext-latency', default=None, help="latency spec for every ERPNext endpoint, e.g. fixed:0.01")
+    parser.add_argument('--erpnext-error-rate', type=float, default=0.0)
+    parser.add_argument('--erpnext-throttle-rate', type=float, default=0.0)
+    parser.add_argument('--set', action='append', metavar='KEY=VALUE', help="local_config override, repeatable")
+    parser.add_argument('--output', default='bench_sync_results.json')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args.child)
+
+    sys.path.insert(0, BENCH_DIR)
+    from erpnext_mock import ERPNextMock
+
+    mock = ERPNextMock(
+        employees=args.users,
+        latency={'*': args.erpnext_latency} if args.erpnext_latency else None,
+        error_rate={'*': args.erpnext_error_rate},
+        throttle_rate={'*': args.erpnext_throttle_rate},
+    ).start()
+    overrides = parse_overrides(args.set)
+    scenarios = []
+    print(f"{'devices':>8} {'punches':>8} {'cycle':>5} {'wall s':>9} {'punch/s':>9} {'http/punch':>10} {'rss MB':>7}  slowest stages")
+    try:
+        for devices in args.devices:
+            for punches in args.punches:
+                scenario = run_scenario(devices, punches, args, mock, overrides)
+                scenarios.append(scenario)
+                for cycle in scenario['cycles']:
+                    stages = {name: seconds for name, seconds in cycle['stages'].items() if name != 'fetch_wall'}
+                    slowest = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in sorted(stages.items(), key=lambda item: -item[1])[:3])
+                    print(f"{devices:>8} {punches:>8} {cycle['cycle']:>5} {cycle['wall_seconds']:>9.3f} "
+                          f"{cycle['punches_per_second'] or 0:>9.0f} {cycle['http_calls_per_punch'] or 0:>10.3f} "
+                          f"{scenario['peak_rss_kb'] / 1024:>7.1f}  {slowest}")
+    finally:
+        mock.stop()
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('child', 'output')},
+        'scenarios': scenarios,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Regression check: zk_tail.get_attendance_tail against pyzk's get_attendance.
+
+zk_tail decodes the attendance buffer itself, so every record layout it
+knows (8, 16 and 40 bytes) is read from a simulated terminal over TCP and
+UDP, once in full with conn.get_attendance() and as tails from several
+record offsets, and the decoded records must be identical. The terminal
+also holds punches of users that are not enrolled, which the 8 and
+16-byte layouts decode differently. Exits with status 1 on any mismatch.
+
+    python benchmarks/check_zk_tail.py
+    python benchmarks/check_zk_tail.py --records 5000 --layouts 8 16
+"""
+import argparse
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from zk import ZK
+
+from zk_simulator import RECORD_LAYOUTS, ZKSimulator
+from zk_tail import get_attendance_tail
+
+UNENROLLED_USERS = ('9001', '9002')
+
+
+def as_tuples(attendances):
+    return [(a.user_id, a.timestamp, a.status, a.punch, a.uid) for a in attendances]
+
+
+def check(record_size, force_udp, records, users):
+    """Return the list of mismatches for one layout and transport."""
+    simulator = ZKSimulator(users=users, records=records, seed=record_size, record_size=record_size).start()
+    try:
+        start = datetime.datetime.now().replace(microsecond=0)
+        for index, user_id in enumerate(UNENROLLED_USERS):
+            simulator.terminal.add_punch(user_id, start + datetime.timedelta(seconds=index + 1))
+        total = records + len(UNENROLLED_USERS)
+        conn = ZK('127.0.0.1', port=simulator.port, timeout=10, ommit_ping=True, force_udp=force_udp).connect()
+        try:
+            full = as_tuples(conn.get_attendance())
+            mismatches = []
+            if len(full) != total:
+                mismatches.append(f"get_attendance returned {len(full)} of {total} records")
+            for known in sorted({0, 1, records // 3, records - 1, total - 1, total}):
+                conn.read_sizes()
+                result = get_attendance_tail(conn, known)
+                if result is None:
+                    mismatches.append(f"tail from {known}: not readable")
+                    continue
+                tail, tail_records = result
+                if tail_records != total:
+                    mismatches.append(f"tail from {known}: {tail_records} records reported, expected {total}")
+                if as_tuples(tail) != full[known:]:
+                    first = next((i for i, (a, b) in enumerate(zip(as_tuples(tail), full[known:])) if a != b), None)
+                    mismatches.append(f"tail from {known}: {len(tail)} records differ from get_attendance (first at {first})")
+            return mismatches
+        finally:
+            conn.disconnect()
+    finally:
+        simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=3000, help="records per terminal (enough to span several chunks)")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--layouts', type=int, nargs='+', choices=RECORD_LAYOUTS, default=list(RECORD_LAYOUTS))
+    args = parser.parse_args()
+
+    failed = False
+    for record_size in args.layouts:
+        for force_udp in (False, True):
+            mismatches = check(record_size, force_udp, args.records, args.users)
+            transport = 'udp' if force_udp else 'tcp'
+            print(f"{record_size:>2}-byte records over {transport}: {'ok' if not mismatches else 'FAILED'}")
+            for mismatch in mismatches:
+                print(f"    {mismatch}")
+            failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+"""Local stand-in for the ERPNext REST endpoints used by the sync.
+
+Serves GET/POST /api/resource/Employee Checkin, GET /api/resource/Employee
+and POST /api/method/frappe.client.insert_many with frappe's filters
+(list or dict form), fields, limit_start/limit_page_length paging and
+order_by, rejects a second checkin for the same employee and time like
+Employee Checkin validation does, and rolls back a whole insert_many on
+any invalid doc. Latency distributions, 429/5xx injection and a request
+rate limit are configurable per endpoint (employee, checkin_list,
+checkin_insert, insert_many, or * for all):
+
+    python benchmarks/erpnext_mock.py --port 8000 --employees 500
+    python benchmarks/erpnext_mock.py --latency '*=lognormal:-3,0.5' --latency insert_many=uniform:0.05,0.2 \\
+        --error-rate checkin_insert=0.02 --throttle-rate 0.01 --rate-limit 50
+
+Latency specs are fixed:S, uniform:A,B, normal:MEAN,SD, lognormal:MU,SIGMA
+or exp:MEAN (seconds). GET /__stats returns the request counters per
+endpoint and status plus the number of checkins stored; POST /__reset
+clears both. From Python, use ERPNextMock(...).start() and its `url`.
+"""
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INSERT_MANY_LIMIT = 200
+DEFAULT_PAGE_LENGTH = 20
+ENDPOINTS = ('employee', 'checkin_list', 'checkin_insert', 'insert_many')
+
+
+def parse_latency(spec):
+    """Turn 'kind:args' into a function returning a delay in seconds."""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',')] if args else []
+    distributions = {
+        'fixed': lambda rng: values[0],
+        'uniform': lambda rng: rng.uniform(values[0], values[1]),
+        'normal': lambda rng: rng.gauss(values[0], values[1]),
+        'lognormal': lambda rng: rng.lognormvariate(values[0], values[1]),
+        'exp': lambda rng: rng.expovariate(1 / values[0]),
+    }
+    if kind not in distributions:
+        raise ValueError(f"unknown latency distribution {spec!r}")
+    return distributions[kind]
+
+
+def _compare(value, operator, operand):
+    if operator == '=':
+        return value == operand
+    if operator == '!=':
+        return value != operand
+    if operator == 'in':
+        return value in operand
+    if operator == 'not in':
+        return value not in operand
+    if operator == 'between':
+        return operand[0] <= value <= operand[1]
+    if operator == '>':
+        return value > operand
+    if operator == '<':
+        return value < operand
+    if operator == '>=':
+        return value >= operand
+    if operator == '<=':
+        return value <= operand
+    if operator == 'like':
+        return operand.strip('%') in (value or '')
+    raise ValueError(f"unsupported filter operator {operator!r}")
+
+
+def matches(doc, filters):
+    """frappe filters: [[field, op, value], ...] or {field: value | [op, value]}."""
+    if isinstance(filters, dict):
+        filters = [[field, *value] if isinstance(value, list) else [field, '=', value] for field, value in filters.items()]
+    for condition in filters:
+        field, operator, operand = condition[-3:]
+        value = doc.get(field)
+        if field == 'time':
+            value = str(value)
+            operand = [str(item) for item in operand] if isinstance(operand, list) else str(operand)
+        if not _compare(value, operator.lower(), operand):
+            return False
+    return True
+
+
+class ERPNextMock:
+    """In-memory ERPNext with Employee and Employee Checkin.
+
+    `employees` active employees T000001... are created, of which the
+    `inactive_share` last ones have status Left. `latency`, `error_rate`
+    and `throttle_rate` map an endpoint (or '*') to a latency spec or a
+    probability of answering 5xx or 429 (with Retry-After `retry_after`).
+    `rate_limit` answers 429 to requests beyond that many per second.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, employees=100, inactive_share=0.0, latency=None, error_rate=None,
+                 throttle_rate=None, retry_after=1, rate_limit=None, seed=None):
+        self.random = random.Random(seed)
+        inactive_from = employees - int(employees * inactive_share)
+        self.employees = {
+            f"T{i:06d}": {'name': f"T{i:06d}", 'employee': f"T{i:06d}", 'status': 'Active' if i <= inactive_from else 'Left'}
+            for i in range(1, employees + 1)
+        }
+        self.latency = {endpoint: parse_latency(spec) for endpoint, spec in (latency or {}).items()}
+        self.error_rate = error_rate or {}
+        self.throttle_rate = throttle_rate or {}
+        self.retry_after = retry_after
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.reset()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def reset(self):
+        with self.lock:
+            self.checkins = {}
+            self.checkin_keys = set()
+            self.counters = Counter()
+            self.sequence = 0
+            self.window_start = time.monotonic()
+            self.window_count = 0
+
+    def stats(self):
+        with self.lock:
+            counters = {}
+            for (endpoint, status), count in self.counters.items():
+                counters.setdefault(endpoint, {})[str(status)] = count
+            return {'requests': counters, 'checkins': len(self.checkins)}
+
+    def _setting(self, settings, endpoint):
+        return settings.get(endpoint, settings.get('*'))
+
+    def delay(self, endpoint):
+        latency = self._setting(self.latency, endpoint)
+        if latency:
+            time.sleep(max(latency(self.random), 0))
+
+    def injected_failure(self, endpoint):
+        """Return (status, headers) for an injected failure, or None."""
+        with self.lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                if now - self.window_start >= 1:
+                    self.window_start, self.window_count = now, 0
+                self.window_count += 1
+                if self.window_count > self.rate_limit:
+                    return 429, {'Retry-After': str(self.retry_after)}
+        if self.random.random() < (self._setting(self.throttle_rate, endpoint) or 0):
+            return 429, {'Retry-After': str(self.retry_after)}
+        if self.random.random() < (self._setting(self.error_rate, endpoint) or 0):
+            return self.random.choice((500, 502, 503)), {}
+        return None
+
+    def count(self, endpoint, status):
+        with self.lock:
+            self.counters[(endpoint, status)] += 1
+
+    def query(self, docs, params):
+        filters = json.loads(params.get('filters') or '[]')
+        fields = json.loads(params.get('fields') or '["name"]')
+        start = int(params.get('limit_start') or 0)
+        length = int(params.get('limit_page_length') or DEFAULT_PAGE_LENGTH)
+        order_by = (params.get('order_by') or 'name desc').split()
+        rows = [doc for doc in docs if matches(doc, filters)]
+        rows.sort(key=lambda doc: doc.get(order_by[0]) or '', reverse=len(order_by) > 1 and order_by[1].lower() == 'desc')
+        if length:
+            rows = rows[start:start + length]
+        else:
+            rows = rows[start:]
+        return [{field: doc.get(field) for field in fields} for doc in rows]
+
+    def validate_checkin(self, doc, pending_keys=()):
+        """Return the (employee, time) key of a valid checkin, or raise
+        ValueError with the frappe exception type and message."""
+        employee = doc.get('employee')
+        if employee not in self.employees:
+            raise ValueError('LinkValidationError', f"Could not find Employee: {employee}")
+        try:
+            checkin_time = datetime.datetime.fromisoformat(str(doc.get('time'))[:19])
+        except ValueError:
+            raise ValueError('ValidationError', f"Invalid time {doc.get('time')}")
+        key = (employee, checkin_time.strftime('%Y-%m-%d %H:%M:%S'))
+        if key in self.checkin_keys or key in pending_keys:
+            raise ValueError('ValidationError', "This employee already has a log with the same timestamp.")
+        return key
+
+    def insert_checkins(self, docs):
+        """Insert all docs or none; returns (names, error). The names come
+        back unordered, like insert_many on frappe v14+ (built from a set)."""
+        with self.lock:
+            keys = []
+            try:
+                for doc in docs:
+                    keys.append(self.validate_checkin(doc, keys))
+            except ValueError as e:
+                return None, e.args
+            names = []
+            for doc, (employee, checkin_time) in zip(docs, keys):
+                self.sequence += 1
+                name = f"EMP-CKIN-{checkin_time[5:7]}-{checkin_time[:4]}-{self.sequence:06d}"
+                self.checkins[name] = {
+                    'name': name,
+                    'employee': employee,
+                    'time': checkin_time,
+                    'log_type': doc.get('log_type'),
+                    'device_id': doc.get('device_id'),
+                }
+                self.checkin_keys.add((employee, checkin_time))
+                names.append(name)
+            self.random.shuffle(names)
+            return names, None
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _route(self):
+        url = urllib.parse.urlparse(self.path)
+        path = urllib.parse.unquote(url.path).rstrip('/')
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if path == '/api/resource/Employee':
+            return 'employee', params
+        if path == '/api/resource/Employee Checkin':
+            return ('checkin_list' if self.command == 'GET' else 'checkin_insert'), params
+        if path == '/api/method/frappe.client.insert_many':
+            return 'insert_many', params
+        return path, params
+
+    def _handle(self):
+        mock = self.server.mock
+        endpoint, params = self._route()
+        if endpoint == '/__stats':
+            return self._send(200, mock.stats())
+        if endpoint == '/__reset':
+            mock.reset()
+            return self._send(200, {'message': 'ok'})
+        body = self._body() if self.command == 'POST' else None
+        if endpoint not in ENDPOINTS:
+            mock.count(endpoint, 404)
+            return self._send(404, {'exc_type': 'DoesNotExistError'})
+        if not (self.headers.get('Authorization') or '').startswith('token '):
+            mock.count(endpoint, 401)
+            return self._send(401, {'exc_type': 'AuthenticationError'})
+        mock.delay(endpoint)
+        failure = mock.injected_failure(endpoint)
+        if failure:
+            status, headers = failure
+            mock.count(endpoint, status)
+            return self._send(status, {'exc_type': 'TooManyRequestsError' if status == 429 else 'ServerError'}, headers)
+
+        if endpoint == 'employee':
+            status, response = 200, {'data': mock.query(list(mock.employees.values()), params)}
+        elif endpoint == 'checkin_list':
+            with mock.lock:
+                docs = list(mock.checkins.values())
+            status, response = 200, {'data': mock.query(docs, params)}
+        elif endpoint == 'checkin_insert':
+            names, error = mock.insert_checkins([body])
+            if error:
+                status, response = 417, {'exc_type': error[0], 'exception': error[1]}
+            else:
+                status, response = 200, {'data': mock.checkins[names[0]]}
+        else:
+            docs = body.get('docs') or []
+            if isinstance(docs, str):
+                docs = json.loads(docs)
+            if len(docs) > INSERT_MANY_LIMIT:
+                status, response = 417, {'exc_type': 'ValidationError', 'exception': f"Only {INSERT_MANY_LIMIT} inserts allowed in one request"}
+            else:
+                names, error = mock.insert_checkins(docs)
+                if error:
+                    status, response = 417, {'exc_type': error[0], 'exception': error[1]}
+                else:
+                    status, response = 200, {'message': names}
+        mock.count(endpoint, status)
+        self._send(status, response)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+
+def _per_endpoint(values, parse=float):
+    """['insert_many=0.1', '0.01'] -> {'insert_many': 0.1, '*': 0.01}"""
+    settings = {}
+    for value in values or []:
+        endpoint, _, setting = value.rpartition('=')
+        settings[endpoint or '*'] = parse(setting)
+    return settings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock ERPNext server for the biometric sync.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--employees', type=int, default=100)
+    parser.add_argument('--inactive-share', type=float, default=0.0, help="share of employees with status Left")
+    parser.add_argument('--latency', action='append', help="[endpoint=]distribution:args, repeatable")
+    parser.add_argument('--error-rate', action='append', help="[endpoint=]probability of a 5xx, repeatable")
+    parser.add_argument('--throttle-rate', action='append', help="[endpoint=]probability of a 429, repeatable")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--rate-limit', type=int, default=None, help="requests per second before answering 429")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    mock = ERPNextMock(
+        args.host, args.port, args.employees, args.inactive_share,
+        latency=_per_endpoint(args.latency, parse=str),
+        error_rate=_per_endpoint(args.error_rate),
+        throttle_rate=_per_endpoint(args.throttle_rate),
+        retry_after=args.retry_after,
+        rate_limit=args.rate_limit,
+        seed=args.seed
+    )
+    print(f"ERPNEXT_URL = '{mock.url}'")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+        print(json.dumps(mock.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,494 @@
+"""Simulated ZK attendance terminals for load and regression testing.
+
+Speaks the subset of the ZK protocol that pyzk uses for connect,
+read_sizes, get_users, get_attendance (buffered reads), live_capture,
+enable/disable_device, clear_attendance and disconnect, over TCP and UDP
+on the same port like a real terminal. Users, stored records, the rate of
+new punches, reply latency, packet loss and crashes in the middle of a
+transfer are configurable:
+
+    python benchmarks/zk_simulator.py --devices 4 --port 4370 --users 500 --records 20000
+    python benchmarks/zk_simulator.py --punch-rate 2 --latency 0.01 --loss 0.02 --crash-rate 0.05
+
+Point the devices of local_config at 127.0.0.1 and the printed ports, with
+'ommit_ping': True (and 'force_udp': True to test UDP). From Python, start
+instances with ZKSimulator(...).start() and read `.port`.
+"""
+import argparse
+import collections
+import datetime
+import itertools
+import random
+import socketserver
+import threading
+import time
+from struct import pack, unpack
+
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_ENABLEDEVICE = 1002
+CMD_DISABLEDEVICE = 1003
+CMD_AUTH = 1102
+CMD_PREPARE_BUFFER = 1503
+CMD_READ_BUFFER = 1504
+CMD_FREE_DATA = 1502
+CMD_PREPARE_DATA = 1500
+CMD_DATA = 1501
+CMD_GET_FREE_SIZES = 50
+CMD_CLEAR_ATTLOG = 15
+CMD_USERTEMP_RRQ = 9
+CMD_ATTLOG_RRQ = 13
+CMD_CANCELCAPTURE = 62
+CMD_STARTVERIFY = 60
+CMD_REG_EVENT = 500
+CMD_GET_TIME = 201
+CMD_ACK_OK = 2000
+CMD_ACK_ERROR = 2001
+CMD_ACK_UNKNOWN = 0xffff
+EF_ATTLOG = 1
+
+TCP_MAGIC = (20560, 32130)
+USHRT_MAX = 65535
+UDP_DATA_SIZE = 1024
+RECORD_LAYOUTS = (8, 16, 40)
+
+
+def checksum(packet):
+    """ZK packet checksum (zkemsdk.c), over a header whose checksum is 0."""
+    total = 0
+    for i in range(0, len(packet) - 1, 2):
+        total += packet[i] | packet[i + 1] << 8
+        if total > USHRT_MAX:
+            total -= USHRT_MAX
+    if len(packet) % 2:
+        total += packet[-1]
+    while total > USHRT_MAX:
+        total -= USHRT_MAX
+    total = ~total
+    while total < 0:
+        total += USHRT_MAX
+    return total
+
+
+def make_packet(command, session_id, reply_id, data=b''):
+    unsigned = pack('<4H', command, 0, session_id, reply_id) + data
+    return pack('<4H', command, checksum(unsigned), session_id, reply_id) + data
+
+
+def encode_time(t):
+    """Timestamp as stored in attendance records (zkemsdk.c EncodeTime)."""
+    return (((t.year % 100) * 12 * 31 + (t.month - 1) * 31 + t.day - 1) * 86400
+            + (t.hour * 60 + t.minute) * 60 + t.second)
+
+
+class TerminalCrashed(Exception):
+    """The simulated terminal went down in the middle of a request."""
+
+
+class Terminal:
+    """State of one simulated terminal: its users and attendance log.
+
+    Records use the 40-byte layout of ZK8 firmware by default, or the 8 or
+    16-byte layouts of older firmware with `record_size`. Users get uids
+    that differ from their user ids, so layouts that store the uid are only
+    decoded right if it is mapped back. While enabled, a background thread
+    adds punches at `punch_rate` per second (random users, the current
+    time) and reports them to live capture sessions.
+    """
+
+    def __init__(self, users=100, records=1000, punch_rate=0.0, record_interval=5, seed=None, record_size=40):
+        if record_size not in RECORD_LAYOUTS:
+            raise ValueError(f"record_size must be one of {sorted(RECORD_LAYOUTS)}")
+        self.random = random.Random(seed)
+        self.record_size = record_size
+        self.users = [str(uid) for uid in range(1, users + 1)]
+        self.uids = {user_id: users + 1 - index for index, user_id in enumerate(self.users, 1)}
+        self.punch_rate = punch_rate
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.live_sessions = set()
+        now = datetime.datetime.now().replace(microsecond=0)
+        start = now - datetime.timedelta(seconds=records * record_interval)
+        self.records = [
+            self._record(self.random.choice(self.users), start + datetime.timedelta(seconds=i * record_interval))
+            for i in range(records)
+        ] if users else []
+        self.punches_added = 0
+        self._stopped = threading.Event()
+
+    def _record(self, user_id, timestamp):
+        # users that are not enrolled (deleted since) keep their user id as uid
+        uid = self.uids.get(user_id, int(user_id))
+        punch = 0 if 8 <= timestamp.hour < 17 else 1
+        time_bytes = pack('<I', encode_time(timestamp))
+        if self.record_size == 8:
+            data = pack('<HB4sB', uid, 1, time_bytes, punch)
+        elif self.record_size == 16:
+            data = pack('<I4sBB2sI', int(user_id), time_bytes, 1, punch, b'', 0)
+        else:
+            data = pack('<H24sB4sB8s', uid, user_id.encode(), 1, time_bytes, punch, b'')
+        return data, user_id, timestamp, punch
+
+    def user_buffer(self):
+        data = b''.join(
+            pack('<HB8s24sIx7sx24s', self.uids[user_id], 0, b'', f"User {user_id}".encode(), 0, b'1', user_id.encode())
+            for user_id in self.users
+        )
+        return pack('<I', len(data)) + data
+
+    def attendance_buffer(self):
+        with self.lock:
+            data = b''.join(record[0] for record in self.records)
+        return pack('<I', len(data)) + data
+
+    def sizes(self):
+        fields = [0] * 20
+        fields[4] = len(self.users)
+        fields[8] = len(self.records)
+        fields[14] = 3000
+        fields[15] = 10000
+        fields[16] = 100000
+        fields[17] = 3000
+        fields[18] = 10000 - len(self.users)
+        fields[19] = 100000 - len(self.records)
+        return pack('<20i', *fields) + pack('<3i', 0, 0, 0)
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    def add_punch(self, user_id=None, timestamp=None):
+        user_id = user_id or self.random.choice(self.users)
+        timestamp = timestamp or datetime.datetime.now().replace(microsecond=0)
+        record = self._record(user_id, timestamp)
+        with self.lock:
+            self.records.append(record)
+            self.punches_added += 1
+            sessions = list(self.live_sessions)
+        for session in sessions:
+            session.send_event(record)
+
+    def run_punches(self):
+        while self.punch_rate and not self._stopped.wait(self.random.expovariate(self.punch_rate)):
+            if self.enabled and self.users:
+                self.add_punch()
+
+    def stop(self):
+        self._stopped.set()
+
+
+class Session:
+    """One pyzk connection: replies to its commands and, once registered
+    for EF_ATTLOG events, receives the terminal's new punches. Like a real
+    terminal it has one event in flight at a time: the next is only sent
+    once the client acknowledged the previous one with CMD_ACK_OK."""
+
+    def __init__(self, simulator, session_id, send):
+        self.simulator = simulator
+        self.terminal = simulator.terminal
+        self.session_id = session_id
+        self.send = send
+        self.buffer = None
+        self.send_lock = threading.Lock()
+        self.events = collections.deque()
+        self.event_in_flight = False
+        self.event_lock = threading.Lock()
+
+    def reply(self, command, reply_id, data=b''):
+        return [make_packet(command, self.session_id, reply_id, data)]
+
+    def handle(self, command, reply_id, data):
+        """Return the packets answering one command."""
+        terminal = self.terminal
+        if command in (CMD_CONNECT, CMD_AUTH, CMD_ENABLEDEVICE, CMD_DISABLEDEVICE, CMD_FREE_DATA,
+                       CMD_CANCELCAPTURE, CMD_STARTVERIFY):
+            if command == CMD_ENABLEDEVICE:
+                terminal.enabled = True
+            elif command == CMD_DISABLEDEVICE:
+                terminal.enabled = False
+            elif command == CMD_FREE_DATA:
+                self.buffer = None
+            return self.reply(CMD_ACK_OK, reply_id)
+        if command == CMD_EXIT:
+            self.close()
+            return self.reply(CMD_ACK_OK, reply_id)
+        if command == CMD_GET_FREE_SIZES:
+            return self.reply(CMD_ACK_OK, reply_id, terminal.sizes())
+        if command == CMD_GET_TIME:
+            return self.reply(CMD_ACK_OK, reply_id, pack('<I', encode_time(datetime.datetime.now())))
+        if command == CMD_CLEAR_ATTLOG:
+            terminal.clear()
+            return self.reply(CMD_ACK_OK, reply_id)
+        if command == CMD_REG_EVENT:
+            flags = unpack('<I', data[:4])[0] if len(data) >= 4 else 0
+            with terminal.lock:
+                if flags & EF_ATTLOG:
+                    terminal.live_sessions.add(self)
+                else:
+                    terminal.live_sessions.discard(self)
+            with self.event_lock:
+                # a new registration starts with nothing waiting for an ACK
+                self.events.clear()
+                self.event_in_flight = False
+            return self.reply(CMD_ACK_OK, reply_id)
+        if command == CMD_PREPARE_BUFFER:
+            _, buffered, fct, _ = unpack('<bhii', data[:11])
+            if buffered == CMD_USERTEMP_RRQ:
+                self.buffer = terminal.user_buffer()
+            elif buffered == CMD_ATTLOG_RRQ:
+                self.buffer = terminal.attendance_buffer()
+            else:
+                return self.reply(CMD_ACK_ERROR, reply_id)
+            return self.reply(CMD_ACK_OK, reply_id, b'\x00' + pack('<I', len(self.buffer)) + b'\x00' * 4)
+        if command == CMD_READ_BUFFER:
+            start, size = unpack('<ii', data[:8])
+            if self.buffer is None:
+                return self.reply(CMD_ACK_ERROR, reply_id)
+            self.simulator.maybe_crash()
+            chunk = self.buffer[start:start + size]
+            if self.simulator.tcp_session(self):
+                return self.reply(CMD_DATA, reply_id, chunk)
+            packets = self.reply(CMD_PREPARE_DATA, reply_id, pack('<I', len(chunk)))
+            for offset in range(0, len(chunk), UDP_DATA_SIZE):
+                packets += self.reply(CMD_DATA, reply_id, chunk[offset:offset + UDP_DATA_SIZE])
+            return packets + self.reply(CMD_ACK_OK, reply_id)
+        if command == CMD_ACK_OK:
+            # acknowledgement of a live event
+            with self.event_lock:
+                self.event_in_flight = False
+            self._send_next_event()
+            return []
+        return self.reply(CMD_ACK_UNKNOWN, reply_id)
+
+    def send_event(self, record):
+        _, user_id, t, punch = record
+        timehex = pack('6B', t.year - 2000, t.month, t.day, t.hour, t.minute, t.second)
+        with self.event_lock:
+            self.events.append(pack('<24sBB6s', user_id.encode(), 1, punch, timehex))
+        self._send_next_event()
+
+    def _send_next_event(self):
+        with self.event_lock:
+            if self.event_in_flight or not self.events:
+                return
+            data = self.events.popleft()
+            self.event_in_flight = True
+        try:
+            self.send([make_packet(CMD_REG_EVENT, self.session_id, 0, data)], delay=False)
+        except OSError:
+            self.close()
+
+    def close(self):
+        with self.terminal.lock:
+            self.terminal.live_sessions.discard(self)
+        with self.event_lock:
+            self.events.clear()
+
+
+class _TCPHandler(socketserver.BaseRequestHandler):
+
+    def _read(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        simulator = self.server.simulator
+        session = None
+
+        def send(packets, delay=True):
+            if delay:
+                simulator.delay()
+                if simulator.random.random() < simulator.loss:
+                    time.sleep(simulator.retransmit_delay)  # TCP resends lost segments
+            payload = b''.join(pack('<HHI', *TCP_MAGIC, len(packet)) + packet for packet in packets)
+            with session.send_lock:
+                self.request.sendall(payload)
+
+        try:
+            while not simulator.stopped.is_set():
+                top = self._read(8)
+                if top is None:
+                    return
+                magic_1, magic_2, length = unpack('<HHI', top)
+                if (magic_1, magic_2) != TCP_MAGIC:
+                    return
+                packet = self._read(length)
+                if packet is None or simulator.is_down():
+                    return
+                command, _, session_id, reply_id = unpack('<4H', packet[:8])
+                if session is None:
+                    session = Session(simulator, simulator.new_session_id(), send)
+                    simulator.tcp_sessions.add(session)
+                packets = session.handle(command, reply_id, packet[8:])
+                if packets:
+                    send(packets)
+                if command == CMD_EXIT:
+                    return
+        except (TerminalCrashed, OSError):
+            return
+        finally:
+            if session is not None:
+                session.close()
+                simulator.tcp_sessions.discard(session)
+
+
+class _UDPHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        simulator = self.server.simulator
+        packet, sock = self.request
+        if len(packet) < 8 or simulator.is_down():
+            return
+        command, _, session_id, reply_id = unpack('<4H', packet[:8])
+        address = self.client_address
+
+        def send(packets, delay=True):
+            if delay:
+                simulator.delay()
+            for packet in packets:
+                if simulator.random.random() >= simulator.loss:
+                    sock.sendto(packet, address)
+
+        if command == CMD_CONNECT:
+            session = Session(simulator, simulator.new_session_id(), send)
+            simulator.udp_sessions[session.session_id] = session
+        else:
+            session = simulator.udp_sessions.get(session_id)
+            if session is None:
+                return
+        try:
+            packets = session.handle(command, reply_id, packet[8:])
+        except TerminalCrashed:
+            return
+        if command == CMD_EXIT:
+            simulator.udp_sessions.pop(session_id, None)
+        if packets:
+            send(packets)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _ThreadingUDPServer(socketserver.ThreadingUDPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ZKSimulator:
+    """A simulated terminal listening on TCP and UDP `port` (0 picks a free one).
+
+    `latency` and `jitter` (seconds) delay every reply, `loss` is the share
+    of UDP datagrams dropped (on TCP it costs `retransmit_delay` instead),
+    and `crash_rate` is the chance that a buffer chunk read takes the
+    terminal down: its connections drop and it ignores everything for
+    `crash_downtime` seconds, like a reboot. `record_size` picks the
+    attendance record layout (see Terminal).
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, users=100, records=1000, punch_rate=0.0, latency=0.0, jitter=0.0,
+                 loss=0.0, crash_rate=0.0, crash_downtime=5.0, retransmit_delay=0.2, seed=None, record_size=40):
+        self.random = random.Random(seed)
+        self.terminal = Terminal(users, records, punch_rate, seed=seed, record_size=record_size)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.crash_rate = crash_rate
+        self.crash_downtime = crash_downtime
+        self.retransmit_delay = retransmit_delay
+        self.crashes = 0
+        self.down_until = 0
+        self.stopped = threading.Event()
+        self.tcp_sessions = set()
+        self.udp_sessions = {}
+        self._session_ids = itertools.count(1)
+        self.tcp_server = _ThreadingTCPServer((host, port), _TCPHandler)
+        self.port = self.tcp_server.server_address[1]
+        self.udp_server = _ThreadingUDPServer((host, self.port), _UDPHandler)
+        self.tcp_server.simulator = self.udp_server.simulator = self
+        self._threads = []
+
+    def new_session_id(self):
+        return next(self._session_ids) % USHRT_MAX
+
+    def tcp_session(self, session):
+        return session in self.tcp_sessions
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+    def is_down(self):
+        return time.monotonic() < self.down_until
+
+    def maybe_crash(self):
+        if self.crash_rate and self.random.random() < self.crash_rate:
+            self.crashes += 1
+            self.down_until = time.monotonic() + self.crash_downtime
+            self.udp_sessions.clear()
+            raise TerminalCrashed()
+
+    def start(self):
+        for target in (self.tcp_server.serve_forever, self.udp_server.serve_forever, self.terminal.run_punches):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.terminal.stop()
+        self.tcp_server.shutdown()
+        self.udp_server.shutdown()
+        self.tcp_server.server_close()
+        self.udp_server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run simulated ZK terminals on localhost.")
+    parser.add_argument('--devices', type=int, default=1, help="number of terminals, on consecutive ports")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4370, help="port of the first terminal")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--records', type=int, default=1000, help="attendance records stored at start")
+    parser.add_argument('--punch-rate', type=float, default=0.0, help="new punches per second per terminal")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every reply")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra reply delay, up to this many seconds")
+    parser.add_argument('--loss', type=float, default=0.0, help="share of UDP datagrams dropped")
+    parser.add_argument('--crash-rate', type=float, default=0.0, help="chance that a chunk read crashes the terminal")
+    parser.add_argument('--crash-downtime', type=float, default=5.0, help="seconds a crashed terminal stays down")
+    parser.add_argument('--record-size', type=int, default=40, choices=RECORD_LAYOUTS, help="attendance record layout in bytes")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    simulators = []
+    for index in range(args.devices):
+        simulators.append(ZKSimulator(
+            args.host, args.port + index, args.users, args.records, args.punch_rate, args.latency, args.jitter,
+            args.loss, args.crash_rate, args.crash_downtime, seed=None if args.seed is None else args.seed + index,
+            record_size=args.record_size
+        ).start())
+    print("devices = [")
+    for index, simulator in enumerate(simulators):
+        print(f"    {{'device_id': 'sim_{index + 1}', 'ip': '{args.host}', 'port': {simulator.port}, 'ommit_ping': True, 'punch_direction': None, 'clear_from_device_on_fetch': False}},")
+    print("]")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for simulator in simulators:
+            simulator.stop()
+        for index, simulator in enumerate(simulators):
+            print(f"sim_{index + 1}: {len(simulator.terminal.records)} records, {simulator.terminal.punches_added} punches added, {simulator.crashes} crashes")
+
+
+if __name__ == '__main__':
+    main()
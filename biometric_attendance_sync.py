@@ -1,21 +1,71 @@
+import argparse
 import os
 import json
+import signal
 import datetime
 import logging
 import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
-from zk import ZK
 import local_config
 import requests
+from erpnext_client import ERPNextClient, ERPNextUnavailable
+from employee_cache import EmployeeStatusCache
+from push_engine import push_concurrently
+from device_cursors import DeviceCursorStore
+from zk_tail import get_attendance_tail
+from punch_journal import PunchJournal
+from punches import Punch, batched, iter_new_punches, to_epoch, to_datetime, format_timestamp
+from punch_outbox import PunchOutbox, PENDING, SENT, DUPLICATE, INACTIVE, FAILED
+from live_capture import LiveCaptureWorker
+from zk_connections import ZKConnectionManager
+from circuit_breaker import CircuitBreaker, CLOSED, HALF_OPEN, OPEN, backoff_delay
+from metrics import MetricsRegistry, MetricsServer
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 SYNC_INTERVAL = 3 * 60  
+PULL_FREQUENCY = getattr(local_config, 'PULL_FREQUENCY', None)
+PULL_INTERVAL = PULL_FREQUENCY * 60 if PULL_FREQUENCY else SYNC_INTERVAL
 LAST_SYNC_FILE = 'last_sync_time.json'
+DEVICE_TAIL_FETCH = getattr(local_config, 'DEVICE_TAIL_FETCH', True)
+DEVICE_CURSOR_FILE = getattr(local_config, 'DEVICE_CURSOR_FILE', 'device_cursors.json')
 
 device_punch_values_IN = getattr(local_config, 'device_punch_values_IN', [0, 4])
 device_punch_values_OUT = getattr(local_config, 'device_punch_values_OUT', [1, 5])
+DEVICE_FETCH_WORKERS = getattr(local_config, 'DEVICE_FETCH_WORKERS', 8)
+DEVICE_FETCH_TIMEOUT = getattr(local_config, 'DEVICE_FETCH_TIMEOUT', 60)
+DEVICE_FORCE_UDP = getattr(local_config, 'DEVICE_FORCE_UDP', False)
+DEVICE_OMMIT_PING = getattr(local_config, 'DEVICE_OMMIT_PING', False)
+DEVICE_FETCH_RETRIES = getattr(local_config, 'DEVICE_FETCH_RETRIES', 3)
+DEVICE_BREAKER_THRESHOLD = getattr(local_config, 'DEVICE_BREAKER_THRESHOLD', 3)
+DEVICE_BREAKER_BASE_DELAY = getattr(local_config, 'DEVICE_BREAKER_BASE_DELAY', 60)
+DEVICE_BREAKER_MAX_DELAY = getattr(local_config, 'DEVICE_BREAKER_MAX_DELAY', 60 * 60)
+ERPNEXT_CONNECT_TIMEOUT = getattr(local_config, 'ERPNEXT_CONNECT_TIMEOUT', 5)
+ERPNEXT_READ_TIMEOUT = getattr(local_config, 'ERPNEXT_READ_TIMEOUT', 30)
+ERPNEXT_POOL_SIZE = getattr(local_config, 'ERPNEXT_POOL_SIZE', 10)
+ERPNEXT_SLOW_THRESHOLD = getattr(local_config, 'ERPNEXT_SLOW_THRESHOLD', 10)
+ERPNEXT_BREAKER_THRESHOLD = getattr(local_config, 'ERPNEXT_BREAKER_THRESHOLD', 5)
+ERPNEXT_BREAKER_FAILURE_RATE = getattr(local_config, 'ERPNEXT_BREAKER_FAILURE_RATE', 0.5)
+ERPNEXT_BREAKER_BASE_DELAY = getattr(local_config, 'ERPNEXT_BREAKER_BASE_DELAY', 30)
+ERPNEXT_BREAKER_MAX_DELAY = getattr(local_config, 'ERPNEXT_BREAKER_MAX_DELAY', 15 * 60)
+PUSH_CONCURRENCY = getattr(local_config, 'PUSH_CONCURRENCY', 4)
+PUSH_RATE_LIMIT = getattr(local_config, 'PUSH_RATE_LIMIT', 10)
+LIVE_CAPTURE = getattr(local_config, 'LIVE_CAPTURE', False)
+LIVE_CAPTURE_TIMEOUT = getattr(local_config, 'LIVE_CAPTURE_TIMEOUT', 10)
+LIVE_BATCH_WINDOW = getattr(local_config, 'LIVE_BATCH_WINDOW', 1)
+OUTBOX_FILE = getattr(local_config, 'OUTBOX_FILE', os.path.join(local_config.LOGS_DIRECTORY, 'outbox.sqlite3'))
+OUTBOX_BATCH_SIZE = getattr(local_config, 'OUTBOX_BATCH_SIZE', 500)
+OUTBOX_MAX_ATTEMPTS = getattr(local_config, 'OUTBOX_MAX_ATTEMPTS', 5)
+EMPLOYEE_CACHE_TTL = getattr(local_config, 'EMPLOYEE_CACHE_TTL', 60 * 60)
+CHECKIN_PAGE_SIZE = getattr(local_config, 'CHECKIN_PAGE_SIZE', 1000)
+CHECKIN_BATCH_SIZE = min(getattr(local_config, 'CHECKIN_BATCH_SIZE', 50), 200)  # frappe caps insert_many at 200 docs
+EMPLOYEE_CACHE_FILE = getattr(local_config, 'EMPLOYEE_CACHE_FILE', os.path.join(local_config.LOGS_DIRECTORY, 'employee_cache.json'))
+METRICS_PORT = getattr(local_config, 'METRICS_PORT', None)
+METRICS_HOST = getattr(local_config, 'METRICS_HOST', '127.0.0.1')
 
 EMAIL_SENDER = local_config.EMAIL_SENDER
 EMAIL_RECEIVER = local_config.EMAIL_RECEIVER
@@ -47,6 +97,65 @@ error_logger = setup_logger('_biometric_error_logger', local_config.LOGS_DIRECTO
 attendance_success_logger = setup_logger('attendance_success_logger', local_config.LOGS_DIRECTORY)
 attendance_failed_logger = setup_logger('attendance_failed_logger', local_config.LOGS_DIRECTORY)
 
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+metrics = MetricsRegistry(prefix='biometric_sync_')
+cycle_seconds = metrics.histogram('cycle_duration_seconds', "Duration of a fetch and push cycle.", buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800))
+last_cycle_time = metrics.gauge('last_cycle_timestamp_seconds', "Unix time the last sync cycle finished.")
+device_fetch_seconds = metrics.histogram('device_fetch_duration_seconds', "Time taken to read a device.", labels=('device',))
+device_records = metrics.gauge('device_records', "Attendance records stored on a device at its last read.", labels=('device',))
+device_punches = metrics.counter('device_punches_fetched_total', "New punches read from a device.", labels=('device',))
+device_errors = metrics.counter('device_fetch_errors_total', "Failed reads of a device.", labels=('device',))
+device_last_success = metrics.gauge('device_last_success_timestamp_seconds', "Unix time of the last successful read of a device.", labels=('device',))
+erpnext_request_seconds = metrics.histogram('erpnext_request_duration_seconds', "ERPNext API request latency.", labels=('method', 'endpoint', 'status'))
+punches_pushed = metrics.counter('punches_pushed_total', "Outbox punches by push outcome.", labels=('result',))
+outbox_punches = metrics.gauge('outbox_punches', "Punches in the outbox by state.", labels=('state',))
+
+erpnext_breaker = CircuitBreaker(
+    "ERPNext",
+    failure_threshold=ERPNEXT_BREAKER_THRESHOLD,
+    base_delay=ERPNEXT_BREAKER_BASE_DELAY,
+    max_delay=ERPNEXT_BREAKER_MAX_DELAY,
+    failure_rate=ERPNEXT_BREAKER_FAILURE_RATE,
+    logger=info_logger
+)
+erpnext = ERPNextClient(
+    local_config.ERPNEXT_URL,
+    local_config.ERPNEXT_API_KEY,
+    local_config.ERPNEXT_API_SECRET,
+    connect_timeout=ERPNEXT_CONNECT_TIMEOUT,
+    read_timeout=ERPNEXT_READ_TIMEOUT,
+    pool_size=ERPNEXT_POOL_SIZE,
+    breaker=erpnext_breaker,
+    slow_threshold=ERPNEXT_SLOW_THRESHOLD,
+    on_request=lambda method, endpoint, status, seconds: erpnext_request_seconds.observe(seconds, method=method, endpoint=endpoint, status=status)
+)
+employee_cache = EmployeeStatusCache(erpnext, ttl=EMPLOYEE_CACHE_TTL, snapshot_file=EMPLOYEE_CACHE_FILE, logger=error_logger)
+employee_cache.load()
+device_cursors = DeviceCursorStore(DEVICE_CURSOR_FILE)
+device_cursors.load()
+outbox = PunchOutbox(OUTBOX_FILE, max_attempts=OUTBOX_MAX_ATTEMPTS)
+zk_connections = ZKConnectionManager(timeout=DEVICE_FETCH_TIMEOUT, force_udp=DEVICE_FORCE_UDP, ommit_ping=DEVICE_OMMIT_PING)
+shutdown_requested = threading.Event()
+live_punches = queue.Queue()
+gap_fill_devices = set()
+gap_fill_lock = threading.Lock()
+device_breakers = {}
+device_breakers_lock = threading.Lock()
+
+def _device_breaker_states():
+    with device_breakers_lock:
+        return {(device_id,): BREAKER_STATES[breaker.state] for device_id, breaker in device_breakers.items()}
+
+def _employee_cache_hit_ratio():
+    lookups = employee_cache.hits + employee_cache.misses
+    return employee_cache.hits / lookups if lookups else None
+
+metrics.gauge('device_breaker_state', "Device circuit breaker: 0 closed, 1 half-open, 2 open.", labels=('device',), collect=_device_breaker_states)
+metrics.gauge('erpnext_breaker_state', "ERPNext circuit breaker: 0 closed, 1 half-open, 2 open.", collect=lambda: BREAKER_STATES[erpnext_breaker.state])
+metrics.counter('employee_cache_hits_total', "Employee status lookups answered from the cache (one per employee per push batch).", collect=lambda: employee_cache.hits)
+metrics.counter('employee_cache_misses_total', "Employee status lookups that had to fetch from ERPNext.", collect=lambda: employee_cache.misses)
+metrics.gauge('employee_cache_hit_ratio', "Share of employee status lookups answered from the cache.", collect=_employee_cache_hit_ratio)
+
 def send_email(subject, body):
     try:
         msg = MIMEMultipart()
@@ -64,11 +173,12 @@ def send_email(subject, body):
     except Exception as e:
         error_logger.error(f"Failed to send email: {e}")
 def cleanup_old_biometric_files():
-    """Deletes old biometric_data_{date}.json files at the end of the day."""
+    """Deletes old biometric_data_{date} journals and key files at the end of the day."""
     current_date = datetime.datetime.now().strftime('%Y-%m-%d')
     for file in os.listdir(local_config.LOGS_DIRECTORY):
-        if file.startswith("biometric_data_") and file.endswith(".json"):
-            date_part = file.replace("biometric_data_", "").replace(".json", "")
+        name, extension = os.path.splitext(file)
+        if file.startswith("biometric_data_") and extension in (".json", ".jsonl", ".keys"):
+            date_part = name.replace("biometric_data_", "")
             try:
                 file_date = datetime.datetime.strptime(date_part, '%d-%m-%Y') if '-' in date_part and date_part[2] == '-' else datetime.datetime.strptime(date_part, '%Y-%m-%d')
                 if file_date.strftime('%Y-%m-%d') < current_date:
@@ -88,61 +198,221 @@ def update_last_sync_time():
     last_sync_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     with open(LAST_SYNC_FILE, 'w') as f:
         json.dump({'last_sync_time': last_sync_time}, f)
-def get_all_attendance_from_device(ip, device_id, last_sync_time, retries=3, delay=5):
-    """Fetch attendance logs from the device with retry logic."""
-    zk = ZK(ip)
-    conn = None
-    attendances = []
-    attempt = 0 
-    while attempt < retries:
+def clear_delivered_attendance(conn, ip, known_records):
+    """Clear the device's attendance log if it still holds exactly the
+    `known_records` records already read and settled.
+
+    The device is disabled while the count is re-checked and the log is
+    cleared, so no punch can be recorded in between. Returns True if the
+    log was cleared.
+    """
+    conn.disable_device()
+    try:
+        conn.read_sizes()
+        if conn.records != known_records:
+            return False
+        conn.clear_attendance()
+    finally:
+        conn.enable_device()
+    info_logger.info(f"Cleared {known_records} delivered records from device {ip}")
+    return True
+
+def get_all_attendance_from_device(ip, device_id, last_sync_time, retries=DEVICE_FETCH_RETRIES, delay=5, timeout=DEVICE_FETCH_TIMEOUT, known_records=None, device=None, clear=False):
+    """Fetch attendance logs newer than last_sync_time from the device with retry logic.
+
+    Returns the new logs and the total number of records on the device.
+    Nothing is downloaded while the count still equals `known_records`, and
+    with `clear` the log is then cleared (see clear_delivered_attendance).
+    """
+    device = device or {'device_id': device_id, 'ip': ip}
+
+    def read(conn):
+        # read_sizes is also the liveness check of a reused session
+        conn.read_sizes()
+        records = conn.records
+        if known_records is not None and records == known_records:
+            if clear and records and clear_delivered_attendance(conn, ip, known_records):
+                return [], 0
+            return [], records
+        tail = None
+        if DEVICE_TAIL_FETCH and known_records is not None:
+            tail = get_attendance_tail(conn, known_records)
+        if tail is not None:
+            return tail
+        logs = conn.get_attendance()
+        if last_sync_time is None:
+            return logs, conn.records
+        return [log for log in logs if log.timestamp > last_sync_time], conn.records
+
+    attempt = 0
+    deadline = time.monotonic() + timeout
+    while True:
         try:
-            conn = zk.connect()
-            logs = conn.get_attendance()
-            for log in logs:
-                if log.timestamp > last_sync_time:
-                    attendances.append(log)
-            break
+            return zk_connections.run(device, read)
         except Exception as e:
             error_logger.error(f"Error fetching data from device {ip}: {e}")
             attempt += 1
-            if attempt < retries:
-                error_logger.info(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-    if conn:
-        conn.disconnect()
-    return attendances
-def check_employee_status(employee):
+            wait = backoff_delay(delay, attempt - 1)
+            if attempt >= retries or time.monotonic() + wait >= deadline:
+                raise
+            info_logger.info(f"Retrying device {ip} in {wait:.1f} seconds...")
+            if shutdown_requested.wait(wait):
+                raise
+
+def device_breaker(device_id):
+    """Return the circuit breaker guarding polls of the given device."""
+    with device_breakers_lock:
+        breaker = device_breakers.get(device_id)
+        if breaker is None:
+            breaker = device_breakers[device_id] = CircuitBreaker(
+                f"device {device_id}",
+                failure_threshold=DEVICE_BREAKER_THRESHOLD,
+                base_delay=DEVICE_BREAKER_BASE_DELAY,
+                max_delay=DEVICE_BREAKER_MAX_DELAY,
+                logger=info_logger
+            )
+        return breaker
+
+def _new_device_report(device):
+    return {'device_id': device.get('device_id'), 'ip': device.get('ip'), 'logs': [], 'records': None, 'unchanged': False, 'complete': False,
+            'cleared': False, 'error': None, 'skipped': False, 'duration': 0, 'breaker': None}
+
+def _fetch_device_report(device, last_sync_time, clear=False):
+    started = time.monotonic()
+    report = _new_device_report(device)
+    # the cursors are read before allow(), which may start a half-open probe
+    # that only the device read below may end
+    since = device_cursors.get_timestamp(device['device_id']) or last_sync_time
+    known_records = device_cursors.get_records(device['device_id'])
+    complete = device_cursors.is_complete(device['device_id'])
+    breaker = device_breaker(device['device_id'])
+    if not breaker.allow():
+        # a terminal known to be down is not waited on until its next probe
+        report['skipped'] = True
+        report['error'] = f"circuit open, next probe in {breaker.retry_in():.0f}s"
+        report['breaker'] = breaker.state
+        return report
+    if device.get('clear_from_device_on_fetch') and not complete:
+        # the records older than the cursor were never read; read the whole
+        # buffer once so they are queued before the device may be cleared
+        since = known_records = None
     try:
-        url = local_config.ERPNEXT_URL + "/api/resource/Employee"
-        headers = {
-            'Authorization': f"token {local_config.ERPNEXT_API_KEY}:{local_config.ERPNEXT_API_SECRET}",
-            'Accept': 'application/json'
-        }
-        params = {"filters": json.dumps({"employee": employee}), "fields": '["status"]'}
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            data = response.json().get('data', [])
-            return bool(data and data[0].get('status') == 'Active')
-        else:
-            error_logger.error(f"Failed to check employee status for {employee}: {response.status_code} - {response.text}")
-            return False
-    except requests.exceptions.RequestException as e:
-        error_logger.error(f"Request exception while checking status for {employee}: {e}")
-        return False
-    
+        # a half-open probe gets one attempt, so it cannot hold up the cycle
+        retries = 1 if breaker.state != CLOSED else DEVICE_FETCH_RETRIES
+        attendances, report['records'] = get_all_attendance_from_device(device['ip'], device['device_id'], since, retries=retries, known_records=known_records, device=device, clear=clear)
+        report['logs'] = [Punch.from_attendance(attendance, device['device_id']) for attendance in attendances]
+        report['unchanged'] = known_records is not None and report['records'] == known_records
+        report['complete'] = complete or len(attendances) == report['records']
+        breaker.record_success()
+    except Exception as e:
+        report['error'] = str(e) or e.__class__.__name__
+        breaker.record_failure()
+    report['cleared'] = clear and report['records'] == 0 and bool(known_records)
+    report['duration'] = time.monotonic() - started
+    report['breaker'] = breaker.state
+    return report
+
+def record_device_metrics(report):
+    device_id = str(report['device_id'])
+    if report['skipped']:
+        return
+    device_fetch_seconds.observe(report['duration'], device=device_id)
+    if report['error']:
+        device_errors.inc(device=device_id)
+        return
+    device_punches.inc(len(report['logs']), device=device_id)
+    if report['records'] is not None:
+        device_records.set(report['records'], device=device_id)
+    device_last_success.set(time.time(), device=device_id)
+
+def update_outbox_metrics():
+    """Refresh the backlog gauges and return the outbox counts by state.
+    Called from the main thread only, like every other outbox access."""
+    counts = outbox.counts()
+    for state in (PENDING, SENT, DUPLICATE, INACTIVE, FAILED):
+        outbox_punches.set(counts.get(state, 0), state=state)
+    return counts
+
+def iter_device_reports(devices, last_sync_time):
+    """Poll all devices at once on a bounded worker pool and yield each
+    device's report as soon as that device has been read.
+
+    Each device is read from its own cursor; last_sync_time is only used
+    for devices that have no cursor yet. A report holds the fetched
+    punches, the error (if any) and how long the device took. Finished
+    reports wait in a queue of DEVICE_FETCH_WORKERS slots, so workers stop
+    fetching further devices while the consumer is busy pushing.
+
+    Devices with 'clear_from_device_on_fetch' have their log cleared when
+    nothing was recorded since their last read, their whole buffer has been
+    read (see DeviceCursorStore) and every punch read from them is settled
+    in the outbox (sent, duplicate or inactive).
+    """
+    if not devices:
+        return
+    workers = max(1, min(DEVICE_FETCH_WORKERS, len(devices)))
+    finished = queue.Queue(maxsize=workers)
+    stop = threading.Event()
+
+    # decided here because the outbox may only be used from this thread
+    clearable = {
+        device['device_id'] for device in devices
+        if device.get('clear_from_device_on_fetch') and device_cursors.is_complete(device['device_id'])
+        and not outbox.unsettled(device['device_id'])
+    }
+
+    def fetch(device):
+        # every device must put a report, or the consumer waits for it forever
+        started = time.monotonic()
+        try:
+            report = _fetch_device_report(device, last_sync_time, clear=device.get('device_id') in clearable)
+        except Exception as e:
+            report = _new_device_report(device)
+            report['error'] = f"{e.__class__.__name__}: {e}"
+            report['duration'] = time.monotonic() - started
+            breaker = device_breaker(device.get('device_id'))
+            if breaker.state == HALF_OPEN:
+                # a probe that ended without an outcome would keep the breaker
+                # half-open, and the device skipped, for good
+                breaker.record_failure()
+            report['breaker'] = breaker.state
+        while not stop.is_set():
+            try:
+                finished.put(report, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='device-fetch')
+    try:
+        for device in devices:
+            executor.submit(fetch, device)
+        for _ in devices:
+            report = finished.get()
+            record_device_metrics(report)
+            if report['skipped']:
+                info_logger.info(f"Device {report['device_id']} ({report['ip']}) skipped: {report['error']}")
+            elif report['error']:
+                error_logger.error(f"Device {report['device_id']} ({report['ip']}) failed after {report['duration']:.1f}s: {report['error']}")
+            else:
+                info_logger.info(f"Device {report['device_id']} ({report['ip']}) returned {len(report['logs'])} logs in {report['duration']:.1f}s")
+            yield report
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def check_employee_status(employee):
+    """Return True if the employee is Active, using the shared status cache."""
+    return employee_cache.is_active(employee)
+
 def record_exists_in_erpnext(employee, timestamp):
     """Check if an attendance record already exists in ERPNext."""
     try:
-        url = local_config.ERPNEXT_URL + "/api/resource/Employee Checkin"
-        headers = {
-            'Authorization': f"token {local_config.ERPNEXT_API_KEY}:{local_config.ERPNEXT_API_SECRET}",
-            'Accept': 'application/json'
-        }
         params = {
             "filters": json.dumps({"employee": employee, "time": timestamp}),
             "fields": '["name"]'
         }
-        response = requests.get(url, headers=headers, params=params)
+        response = erpnext.get(erpnext.resource_url("Employee Checkin"), params=params)
         
         if response.status_code == 200:
             data = response.json().get('data', [])
@@ -155,112 +425,314 @@ def record_exists_in_erpnext(employee, timestamp):
         return False
 
 
-def send_to_erpnext(employee, timestamp, log_type):
-    """Send new attendance record to ERPNext only if it does not already exist."""
-    if record_exists_in_erpnext(employee, timestamp):
+def fetch_existing_checkin_keys(start, end, page_size=CHECKIN_PAGE_SIZE, employees=None):
+    """Return the Employee Checkins between start and end (of `employees`
+    only, if given) as a dict of (employee, epoch) key to document name.
+
+    Pages through the window once so duplicates can be filtered locally.
+    Returns None if ERPNext could not be queried.
+    """
+    keys = {}
+    filters = [["time", "between", [start, end]]]
+    if employees:
+        filters.append(["employee", "in", sorted(employees)])
+    params = {
+        "filters": json.dumps(filters),
+        "fields": '["name", "employee", "time"]',
+        "order_by": "name asc",
+        "limit_page_length": page_size
+    }
+    limit_start = 0
+    while True:
+        params["limit_start"] = limit_start
+        try:
+            response = erpnext.get(erpnext.resource_url("Employee Checkin"), params=params)
+        except requests.exceptions.RequestException as e:
+            error_logger.error(f"Request exception while fetching checkins between {start} and {end}: {e}")
+            return None
+        if response.status_code != 200:
+            error_logger.error(f"Failed to fetch checkins between {start} and {end}: {response.status_code} - {response.text}")
+            return None
+        rows = response.json().get('data', [])
+        for row in rows:
+            keys[(row.get('employee'), to_epoch(str(row.get('time'))))] = row.get('name')
+        if len(rows) < page_size:
+            return keys
+        limit_start += page_size
+
+def send_to_erpnext(employee, timestamp, log_type, check_exists=True):
+    """Send new attendance record to ERPNext only if it does not already exist.
+
+    Pass check_exists=False when duplicates were already filtered out with
+    fetch_existing_checkin_keys. The status is None when the record was not
+    sent because ERPNext is paused.
+    """
+    if check_exists and record_exists_in_erpnext(employee, timestamp):
         attendance_failed_logger.error(f"Skipped: {employee} at {timestamp} ({log_type}) - Record already exists")
         return 409, "Record already exists"   
 
 
     try:
-        url = local_config.ERPNEXT_URL + "/api/resource/Employee Checkin"
-        headers = {
-            'Authorization': f"token {local_config.ERPNEXT_API_KEY}:{local_config.ERPNEXT_API_SECRET}",
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
         data = {"employee": employee, "time": timestamp, "log_type": log_type}
-        response = requests.post(url, headers=headers, json=data)
+        response = erpnext.post(erpnext.resource_url("Employee Checkin"), json=data)
 
         if response.status_code == 200:
             return 200, response.json().get('data', {}).get('name', 'Success')
         else:
             return response.status_code, response.text
+    except ERPNextUnavailable as e:
+        return None, str(e)
     except requests.exceptions.RequestException as e:
         return 500, str(e)
-def export_biometric_data_and_exit(last_sync_time):
-    """Export biometric data for the date and exit after summary."""
-    date = datetime.datetime.now().strftime('%Y-%m-%d')
-    print(f"Processing biometric data for date: {date}")
-    print(f"Please wait a moment ############...")
 
-    output_file = os.path.join(local_config.LOGS_DIRECTORY, f"biometric_data_{date}.json")
-    data_to_export = []
-    failed_logs = []
-    not_active_logs = []
-    success_logs = []
+def send_batch_to_erpnext(punches):
+    """Insert a chunk of checkins with one frappe.client.insert_many call.
 
+    Returns one (status_code, message) per punch, in the same order. If the
+    batch is rejected, the chunk is retried record by record (with the
+    duplicate check, in case the batch was committed before the error) so
+    that each failure is reported against the punch that caused it.
+
+    insert_many does not return the names in insertion order (frappe v14+
+    collects them in a set), so the names of an inserted batch are looked
+    up by (employee, time); the message is None if that lookup fails.
+    """
+    docs = [{"doctype": "Employee Checkin", "employee": punch.employee, "time": punch.time, "log_type": punch.log_type} for punch in punches]
     try:
-        for device in local_config.devices:
-            logs = get_all_attendance_from_device(device['ip'], device['device_id'], last_sync_time)
-            filtered_logs = []
-
-            for log in logs:
-                punch_time = log.timestamp
-                punch_hour = punch_time.hour
-                punch_direction = 'IN' if 8 <= punch_hour < 17 else 'OUT'
-                filtered_logs.append({
-                    'user_id': f"T{int(log.user_id):06d}",
-                    'timestamp': punch_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'punch_direction': punch_direction,
-                    'log_type': punch_direction
-                })
-            data_to_export.extend(filtered_logs)
-    except Exception as e:
-        error_logger.error(f"Error collecting logs: {e}")
-        return
-    if os.path.exists(output_file):
+        response = erpnext.post(erpnext.method_url("frappe.client.insert_many"), json={"docs": docs})
+        if response.status_code == 200:
+            names = response.json().get('message') or []
+            if len(names) == len(punches):
+                timestamps = [punch.timestamp for punch in punches]
+                inserted = fetch_existing_checkin_keys(
+                    format_timestamp(min(timestamps)), format_timestamp(max(timestamps)),
+                    employees={punch.employee for punch in punches}
+                ) or {}
+                return [(200, inserted.get(punch.key)) for punch in punches]
+        error_logger.error(f"Batch insert of {len(punches)} checkins failed: {response.status_code} - {response.text[:500]}")
+    except ERPNextUnavailable as e:
+        return [(None, str(e))] * len(punches)
+    except requests.exceptions.RequestException as e:
+        error_logger.error(f"Request exception during batch insert of {len(punches)} checkins: {e}")
+    return [send_to_erpnext(punch.employee, punch.time, punch.log_type) for punch in punches]
+
+def update_device_cursor(report, punches):
+    """Advance the cursor of a device that was read successfully."""
+    latest = max((punch.timestamp for punch in punches), default=None)
+    device_cursors.update(report['device_id'], to_datetime(latest) if latest is not None else None, report['records'], report['complete'])
+    try:
+        device_cursors.save()
+    except OSError as e:
+        error_logger.error(f"Failed to save device cursors: {e}")
+
+def queue_device_punches(reports, journal, seen_keys):
+    """Pipeline stage: journal and queue the new punches of each device
+    report in batches of OUTBOX_BATCH_SIZE, advance that device's cursor,
+    and yield the report once its punches are safely in the outbox.
+
+    The report's punch list is released here; only its count is kept.
+    """
+    for report in reports:
+        punches = report['logs']
+        report['logs'] = None
+        report['fetched'] = len(punches)
+        if report['error']:
+            yield report
+            continue
         try:
-            with open(output_file, 'r') as f:
-                existing_data = json.load(f)
-            data_to_export = existing_data + data_to_export  
+            for batch in batched(iter_new_punches(punches, seen_keys), OUTBOX_BATCH_SIZE):
+                try:
+                    journal.append(batch)
+                except Exception as e:
+                    error_logger.error(f"Error writing logs to {journal.path}: {e}")
+                outbox.add(batch)
         except Exception as e:
-            error_logger.error(f"Error reading existing file {output_file}: {e}")
-            return
-    unique_data = {f"{log['user_id']}_{log['timestamp']}": log for log in data_to_export}
-    data_to_export = list(unique_data.values())
-    try:
-        with open(output_file, 'w') as f:
-            json.dump(data_to_export, f, indent=4)
-    except Exception as e:
-        error_logger.error(f"Error writing logs to file: {e}")
+            error_logger.error(f"Error queueing logs of device {report['device_id']} in {outbox.path}: {e}")
+            report['error'] = str(e)
+        else:
+            update_device_cursor(report, punches)
+        yield report
+
+def push_logs(punches):
+    """Push one batch of outbox punches to ERPNext and record the outcome.
+
+    Returns the punches grouped by outcome: success, duplicate, not_active,
+    failed and deferred. Deferred punches were not sent because ERPNext is
+    paused by its circuit breaker; they stay pending in the outbox without
+    counting as an attempt.
+    """
+    results = {'success': [], 'duplicate': [], 'not_active': [], 'failed': [], 'deferred': []}
+    if erpnext_breaker.retry_in() > 0:
+        results['deferred'] = list(punches)
+        return results
+    existing_keys = None
+    if punches:
+        timestamps = [punch.timestamp for punch in punches]
+        existing_keys = fetch_existing_checkin_keys(format_timestamp(min(timestamps)), format_timestamp(max(timestamps)))
+        if existing_keys is None and erpnext_breaker.retry_in() > 0:
+            results['deferred'] = list(punches)
+            return results
+    new_punches = punches
+    if existing_keys:
+        results['duplicate'] = [punch for punch in punches if punch.key in existing_keys]
+        new_punches = [punch for punch in punches if punch.key not in existing_keys]
+        for punch in results['duplicate']:
+            attendance_failed_logger.error(f"Skipped: {punch.employee} at {punch.time} ({punch.log_type}) - Record already exists")
+    employee_cache.prefetch({punch.employee for punch in new_punches})
+
+    active_punches = []
+    failed_messages = []
+    for punch in new_punches:
+        status = employee_cache.get_status(punch.employee, count=False, fetch=False)
+        if status == 'Active':
+            active_punches.append(punch)
+        elif status is None:
+            error = employee_cache.errors.get(punch.employee)
+            if erpnext_breaker.retry_in() > 0 or isinstance(error, ERPNextUnavailable):
+                results['deferred'].append(punch)
+            else:
+                # counted as an attempt, so a lookup that keeps failing ends as failed
+                message = str(error or "Employee status unavailable")[:1000]
+                results['failed'].append(punch)
+                failed_messages.append(message)
+                attendance_failed_logger.error(f"Failed: {punch.employee} at {punch.time} ({punch.log_type}) - {message}")
+        else:
+            results['not_active'].append(punch)
+            attendance_failed_logger.error(f"Not active: {punch.employee} at {punch.time} ({punch.log_type})")
 
-    total_logs = len(data_to_export)
-    if total_logs > 0:
-        print("\n[********* Sending logs to kernel]")
-    new_logs = [log for log in data_to_export if log in filtered_logs]
+    batch_size = max(CHECKIN_BATCH_SIZE, 1) if existing_keys is not None else 1
+    chunks = [active_punches[start:start + batch_size] for start in range(0, len(active_punches), batch_size)]
 
-    for i, log in enumerate(new_logs):
-        percentage = int((i + 1) / len(new_logs) * 100)
-        print(f"\r[********* Sending {percentage}%]", end="")
+    def push_chunk(chunk):
+        if len(chunk) > 1:
+            return send_batch_to_erpnext(chunk)
+        punch = chunk[0]
+        return [send_to_erpnext(punch.employee, punch.time, punch.log_type, check_exists=existing_keys is None)]
 
-        user_id = log['user_id']
-        timestamp = log['timestamp']
-        log_type = log['log_type']
+    def show_progress(completed, total):
+        print(f"\r[********* Sending {int(completed / total * 100)}%]", end="")
 
-        if check_employee_status(user_id):
-            status_code, message = send_to_erpnext(user_id, timestamp, log_type)
+    sent_names = []
+    chunk_results = push_concurrently(chunks, push_chunk, concurrency=PUSH_CONCURRENCY, rate=PUSH_RATE_LIMIT, on_done=show_progress)
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        for punch, (status_code, message) in zip(chunk, chunk_result):
             if status_code == 200:
-                success_logs.append(log)
-                attendance_success_logger.info(f"Success: {user_id} at {timestamp} ({log_type}) - {message}")
+                results['success'].append(punch)
+                sent_names.append(message)
+                attendance_success_logger.info(f"Success: {punch.employee} at {punch.time} ({punch.log_type}) - {message or 'inserted'}")
+            elif status_code is None:
+                results['deferred'].append(punch)
+            elif status_code == 409:
+                results['duplicate'].append(punch)
             else:
-                failed_logs.append(log)
-                attendance_failed_logger.error(f"Failed: {user_id} at {timestamp} ({log_type}) - {message}")
-        else:
-            not_active_logs.append(log)
-            attendance_failed_logger.error(f"Not active: {user_id} at {timestamp} ({log_type})")
+                results['failed'].append(punch)
+                failed_messages.append(f"{status_code} - {message}"[:1000])
+                attendance_failed_logger.error(f"Failed: {punch.employee} at {punch.time} ({punch.log_type}) - {message}")
+
+    outbox.mark(results['success'], SENT, sent_names)
+    outbox.mark(results['duplicate'], DUPLICATE)
+    outbox.mark(results['not_active'], INACTIVE)
+    outbox.mark(results['failed'], FAILED, failed_messages)
+    for result, result_punches in results.items():
+        if result_punches:
+            punches_pushed.inc(len(result_punches), result=result)
+    if results['deferred']:
+        info_logger.info(f"ERPNext paused, {len(results['deferred'])} punches left in the outbox")
+    return results
+
+def drain_outbox(after_id=0, on_results=None):
+    """Push the punches pending in the outbox with after_id < id, up to its
+    newest row right now, passing each batch's results to on_results.
+
+    Returns the id of that newest row, or None if the drain stopped early
+    because of a shutdown request or because ERPNext was paused; the rest
+    stays pending.
+    """
+    last_id = outbox.last_id()
+    for batch in outbox.iter_pending(OUTBOX_BATCH_SIZE, after_id=after_id, last_id=last_id):
+        if shutdown_requested.is_set() or erpnext_breaker.retry_in() > 0:
+            return None
+        results = push_logs(batch)
+        if on_results:
+            on_results(results)
+    return last_id
+
+def run_sync_cycle(last_sync_time, devices=None, journal=None):
+    """Run one fetch and push cycle over the devices (all configured
+    devices by default) and print its summary. Punches are written to
+    `journal`, or to today's journal when none is given.
+
+    Stops between batches once a shutdown was requested; whatever was not
+    pushed yet stays pending in the outbox.
+    """
+    started = time.monotonic()
+    date = datetime.datetime.now().strftime('%Y-%m-%d')
+    print(f"Processing biometric data for date: {date}")
+    print(f"Please wait a moment ############...")
+
+    journal = journal or PunchJournal(local_config.LOGS_DIRECTORY, date)
+    device_reports = []
+    # only counts are kept, so memory does not grow with the backlog
+    pushed = dict.fromkeys(('success', 'duplicate', 'not_active', 'failed'), 0)
+    drained_id = 0
+
+    def collect(results):
+        for outcome in pushed:
+            pushed[outcome] += len(results[outcome])
+
+    def push_pending():
+        nonlocal drained_id
+        last_id = drain_outbox(drained_id, collect)
+        if last_id is not None:
+            drained_id = last_id
+
+    # fetch -> normalize -> dedupe/queue run as chained generators, so the
+    # first device's punches are pushed while later devices still download.
+    reports = iter_device_reports(local_config.devices if devices is None else devices, last_sync_time)
+    pipeline = queue_device_punches(reports, journal, set())
+    for report in pipeline:
+        device_reports.append(report)
+        if report['fetched']:
+            print("\n[********* Sending logs to kernel]")
+        push_pending()
+        if shutdown_requested.is_set():
+            break
+    pipeline.close()
+    reports.close()
+    push_pending()
+    employee_cache.save()
 
     print("\nSummary:")
     print(f" - Last sync time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f" - Not active: {len(not_active_logs)}")
-    print(f" - Failed to push: {len(failed_logs)}")
-    print(f" - Successfully pushed: {len(success_logs)}")  
+    print(f" - Not active: {pushed['not_active']}")
+    print(f" - Already in ERPNext: {pushed['duplicate']}")
+    print(f" - Failed to push: {pushed['failed']}")
+    print(f" - Successfully pushed: {pushed['success']}")
+    print(f" - Waiting in outbox: {update_outbox_metrics().get(PENDING, 0)}")
+    if erpnext_breaker.retry_in() > 0:
+        print(f" - ERPNext paused (circuit {erpnext_breaker.state}), next attempt in {erpnext_breaker.retry_in():.0f}s")
+    for report in device_reports:
+        if report['skipped']:
+            status = f"skipped, {report['error']}"
+        elif report['error']:
+            status = f"error: {report['error']}" + (f" (circuit {report['breaker']})" if report['breaker'] else "")
+        elif report['cleared']:
+            status = "delivered records cleared from device"
+        elif report['unchanged']:
+            status = "no new records"
+        else:
+            status = f"{report['fetched']} logs"
+        print(f" - Device {report['device_id']} ({report['ip']}): {status} in {report['duration']:.1f}s")
     update_last_sync_time()
-    if success_logs:
-        update_last_sync_time()
-        exit(0)  
-    else:
+    cycle_seconds.observe(time.monotonic() - started)
+    last_cycle_time.set(time.time())
+    if not pushed['success']:
         attendance_success_logger.info(f"There is no records exist from Last sync time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}") 
+
+def export_biometric_data_and_exit(last_sync_time):
+    """Export biometric data for the date and exit after summary."""
+    run_sync_cycle(last_sync_time)
+    zk_connections.close_all()
     exit(0)
 def get_recent_errors():
     """Retrieve recent errors from log file."""
@@ -273,23 +745,190 @@ def get_recent_errors():
     except Exception as e:
         error_logger.error(f"Failed to read error log: {e}")
     return "No recent errors found."
-if __name__ == "__main__":
-     cleanup_old_biometric_files()
-     while True:
+def get_last_sync_datetime():
+    last_sync_time_str = get_last_sync_time()
+    return datetime.datetime.strptime(last_sync_time_str, '%Y-%m-%d %H:%M:%S') if last_sync_time_str else datetime.datetime.now() - datetime.timedelta(days=1)
+
+def reopen_daily_logs():
+    """Point the loggers at today's log files once the date has changed."""
+    for logger in (info_logger, error_logger, attendance_success_logger, attendance_failed_logger):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        setup_logger(logger.name, local_config.LOGS_DIRECTORY, level=logger.level)
+
+def request_shutdown(signum, frame):
+    info_logger.info(f"Received signal {signum}, stopping after the current batch.")
+    shutdown_requested.set()
+
+def queue_live_punch(device, attendance):
+    live_punches.put(Punch.from_attendance(attendance, device['device_id']))
+
+def request_gap_fill(device):
+    info_logger.info(f"Live capture connected to device {device['device_id']} ({device['ip']}), polling it for missed punches.")
+    device_breaker(device['device_id']).record_success()
+    with gap_fill_lock:
+        gap_fill_devices.add(device['device_id'])
+
+def start_metrics_server():
+    """Start the metrics endpoint if METRICS_PORT is set; a port that cannot
+    be bound is logged and the daemon runs without it."""
+    if not METRICS_PORT:
+        return None
+    update_outbox_metrics()
+    try:
+        server = MetricsServer(metrics, host=METRICS_HOST, port=METRICS_PORT, logger=error_logger).start()
+    except OSError as e:
+        error_logger.error(f"Failed to start the metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
+        return None
+    info_logger.info(f"Serving metrics on http://{METRICS_HOST}:{server.port}/metrics")
+    return server
+
+def start_live_capture():
+    """Start a live capture worker for every device that has it enabled."""
+    workers = {}
+    for device in local_config.devices:
+        if device.get('live_capture', LIVE_CAPTURE):
+            worker = LiveCaptureWorker(device, queue_live_punch, request_gap_fill, timeout=LIVE_CAPTURE_TIMEOUT, retry_delay=SYNC_INTERVAL // 6, logger=error_logger, connections=zk_connections)
+            worker.start()
+            workers[device['device_id']] = worker
+    return workers
+
+def push_live_punches(timeout, journal):
+    """Wait up to `timeout` seconds for live punches, then write the ones that
+    arrive within LIVE_BATCH_WINDOW of the first to `journal` and push them."""
+    try:
+        punches = [live_punches.get(timeout=max(timeout, 0))]
+    except queue.Empty:
+        return
+    deadline = time.monotonic() + LIVE_BATCH_WINDOW
+    while len(punches) < OUTBOX_BATCH_SIZE:
         try:
-            last_sync_time_str = get_last_sync_time()
-            last_sync_time = datetime.datetime.strptime(last_sync_time_str, '%Y-%m-%d %H:%M:%S') if last_sync_time_str else datetime.datetime.now() - datetime.timedelta(days=1)
+            punches.append(live_punches.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    try:
+        journal.append(punches)
+    except Exception as e:
+        error_logger.error(f"Error writing logs to {journal.path}: {e}")
+    queued_after = outbox.last_id()
+    try:
+        outbox.add(punches)
+    except Exception as e:
+        # the device cursors were not advanced, so polling recovers them
+        error_logger.error(f"Error queueing live punches in {outbox.path}: {e}")
+        with gap_fill_lock:
+            gap_fill_devices.update(punch.device_id for punch in punches)
+        return
+    try:
+        for batch in outbox.iter_pending(OUTBOX_BATCH_SIZE, after_id=queued_after):
+            results = push_logs(batch)
+            info_logger.info(f"Live punches: {len(results['success'])} pushed, {len(results['duplicate'])} already in ERPNext, {len(results['not_active'])} not active, {len(results['failed'])} failed")
+        update_outbox_metrics()
+    except Exception as e:
+        error_logger.error(f"Error pushing live punches: {e}")
 
-            export_biometric_data_and_exit(last_sync_time) 
-        except Exception as e:
-            error_logger.error(f"Error during execution: {e}")
-            recent_errors = get_recent_errors() 
+def devices_to_poll(live_workers, scheduled):
+    """Devices the next cycle must poll: those with a fresh live session
+    (gap fill) and, on schedule, every device without a live session."""
+    with gap_fill_lock:
+        gap_fill = set(gap_fill_devices)
+        gap_fill_devices.clear()
+    devices = []
+    for device in local_config.devices:
+        worker = live_workers.get(device['device_id'])
+        if device['device_id'] in gap_fill or (scheduled and not (worker and worker.connected)):
+            devices.append(device)
+    return devices
 
-            send_email(
-                "Biometric Device Execution Error",
-                f"An error occurred during execution:\n\n{e}\n\nRecent Errors:\n{recent_errors}"
-            )
+def run_daemon():
+    """Run sync cycles every PULL_FREQUENCY minutes in one resident process.
+
+    Connections, caches and cursors stay in memory between cycles. Cycles
+    never overlap: one that overruns its slot makes the next start right
+    after it instead of stacking up. SIGTERM/SIGINT end the loop once the
+    current batch is pushed.
 
-            print("❌ Error encountered! Retrying in 2 minutes...")
-            time.sleep(SYNC_INTERVAL)  
+    With LIVE_CAPTURE, devices stream their punches as they happen and are
+    only polled right after their live session (re)connects; the scheduled
+    cycle just covers devices whose live session is down.
 
+    When ERPNext is paused by its circuit breaker, the outbox backlog is
+    drained as soon as the breaker lets a probe through rather than at the
+    next scheduled cycle.
+
+    With METRICS_PORT, metrics are served in the Prometheus text format on
+    http://METRICS_HOST:METRICS_PORT/metrics while the daemon runs.
+    """
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+    current_date = datetime.date.today()
+    # one journal per day, so its keys are loaded once rather than per batch
+    journal = PunchJournal(local_config.LOGS_DIRECTORY, current_date.strftime('%Y-%m-%d'))
+    cleanup_old_biometric_files()
+    metrics_server = start_metrics_server()
+    live_workers = start_live_capture()
+    next_run = time.monotonic()
+    backlog_paused = False
+    while not shutdown_requested.is_set():
+        if datetime.date.today() != current_date:
+            current_date = datetime.date.today()
+            journal = PunchJournal(local_config.LOGS_DIRECTORY, current_date.strftime('%Y-%m-%d'))
+            reopen_daily_logs()
+            cleanup_old_biometric_files()
+        scheduled = time.monotonic() >= next_run
+        devices = devices_to_poll(live_workers, scheduled)
+        if scheduled or devices:
+            try:
+                run_sync_cycle(get_last_sync_datetime(), devices, journal)
+            except Exception as e:
+                error_logger.error(f"Error during execution: {e}")
+                recent_errors = get_recent_errors()
+
+                send_email(
+                    "Biometric Device Execution Error",
+                    f"An error occurred during execution:\n\n{e}\n\nRecent Errors:\n{recent_errors}"
+                )
+                print(f"❌ Error encountered! Retrying in {PULL_INTERVAL // 60} minutes...")
+            backlog_paused = erpnext_breaker.retry_in() > 0
+        elif backlog_paused and erpnext_breaker.retry_in() == 0:
+            info_logger.info("ERPNext breaker allows a probe, draining the outbox.")
+            try:
+                backlog_paused = drain_outbox() is None
+                update_outbox_metrics()
+            except Exception as e:
+                error_logger.error(f"Error draining the outbox: {e}")
+        if scheduled:
+            next_run += PULL_INTERVAL
+            now = time.monotonic()
+            if next_run < now:
+                skipped = int((now - next_run) // PULL_INTERVAL) + 1
+                info_logger.info(f"Sync cycle overran its interval, skipping {skipped} scheduled run(s).")
+                next_run += skipped * PULL_INTERVAL
+        wait = next_run - time.monotonic()
+        if backlog_paused:
+            wait = min(wait, erpnext_breaker.retry_in())
+        if live_workers:
+            push_live_punches(min(wait, 1), journal)
+        else:
+            shutdown_requested.wait(wait)
+    for worker in live_workers.values():
+        worker.stop()
+    for worker in live_workers.values():
+        worker.join(LIVE_CAPTURE_TIMEOUT + 1)
+    zk_connections.close_all()
+    employee_cache.save()
+    outbox.close()
+    erpnext.close()
+    if metrics_server:
+        metrics_server.stop()
+    info_logger.info("Biometric sync stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync biometric device punches to ERPNext.")
+    parser.add_argument('--once', action='store_true', help="run a single sync cycle and exit")
+    args = parser.parse_args()
+    if args.once:
+        cleanup_old_biometric_files()
+        export_biometric_data_and_exit(get_last_sync_datetime())
+    run_daemon()
@@ -0,0 +1,104 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def backoff_delay(base, attempt, maximum=None, jitter=0.5):
+    """Exponential backoff for the given attempt (0-based): base * 2**attempt,
+    capped at `maximum`, with up to `jitter` of it randomly taken off so that
+    peers retrying together spread out."""
+    delay = base * 2 ** attempt
+    if maximum is not None:
+        delay = min(delay, maximum)
+    return delay * (1 - random.uniform(0, jitter))
+
+
+class CircuitBreaker:
+    """Stops calling a peer that keeps failing.
+
+    The breaker is closed while calls succeed. After `failure_threshold`
+    consecutive failures it opens and allow() returns False for a backoff
+    delay that doubles (with jitter) each time it opens again, up to
+    `max_delay`. Once the delay is over a single probe call is let through
+    (half-open): its success closes the breaker, its failure opens it again.
+
+    With `failure_rate`, the breaker also opens once that share of the last
+    `window` calls failed, even if the failures were not consecutive.
+    """
+
+    def __init__(self, name, failure_threshold=3, base_delay=60, max_delay=3600, failure_rate=None, window=20, logger=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.outcomes = deque(maxlen=window)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_until = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be made now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.opened_until:
+                self.state = HALF_OPEN
+                self.logger.info(f"Circuit {self.name} half-open, probing")
+                return True
+            return False
+
+    def retry_in(self):
+        """Seconds until the next probe is allowed (0 if calls are allowed)."""
+        if self.state != OPEN:
+            return 0
+        return max(self.opened_until - time.monotonic(), 0)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                self.logger.info(f"Circuit {self.name} closed after {self.trips} trip(s)")
+                self.outcomes.clear()
+                self.trips = 0
+            self.state = CLOSED
+            self.failures = 0
+            self.outcomes.append(False)
+
+    def record_failure(self, delay=None):
+        """Count a failed call; `delay` is the least the breaker stays open
+        if it opens, for when the peer said how long to wait (Retry-After)."""
+        with self._lock:
+            self.failures += 1
+            self.outcomes.append(True)
+            if self.state == OPEN:
+                return  # a call that was already in flight when it opened
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold or self._failing():
+                self._open(delay)
+
+    def trip(self, delay=None):
+        """Open the breaker right away, whatever the failure count."""
+        with self._lock:
+            self.failures += 1
+            self._open(delay)
+
+    def _failing(self):
+        if self.failure_rate is None or len(self.outcomes) < self.outcomes.maxlen:
+            return False
+        return sum(self.outcomes) / len(self.outcomes) >= self.failure_rate
+
+    def _open(self, delay):
+        backoff = backoff_delay(self.base_delay, self.trips, self.max_delay)
+        delay = max(delay, backoff) if delay is not None else backoff
+        self.trips += 1
+        self.state = OPEN
+        self.opened_until = time.monotonic() + delay
+        self.logger.warning(f"Circuit {self.name} open for {delay:.0f}s after {self.failures} failure(s)")
@@ -0,0 +1,68 @@
+import datetime
+import json
+import os
+import threading
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class DeviceCursorStore:
+    """Per-device fetch cursors persisted to a JSON file.
+
+    For every device_id it keeps the highest punch timestamp read from that
+    device and the device's attendance record count at that point, so each
+    device resumes exactly where it stopped regardless of what the other
+    devices did. 'complete' records whether every record in the device's
+    buffer has been read (none was left out by the timestamp filter of a
+    first read), which clearing the device depends on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cursors = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.cursors = json.load(f)
+
+    def get_timestamp(self, device_id):
+        cursor = self.cursors.get(device_id)
+        if cursor and cursor.get('timestamp'):
+            return datetime.datetime.strptime(cursor['timestamp'], TIMESTAMP_FORMAT)
+        return None
+
+    def get_records(self, device_id):
+        cursor = self.cursors.get(device_id)
+        return cursor.get('records') if cursor else None
+
+    def is_complete(self, device_id):
+        cursor = self.cursors.get(device_id)
+        return bool(cursor and cursor.get('complete'))
+
+    def update(self, device_id, timestamp=None, records=None, complete=None):
+        """Advance the cursor of a device. The timestamp never moves backwards."""
+        with self._lock:
+            cursor = dict(self.cursors.get(device_id) or {})
+            if timestamp is not None:
+                current = cursor.get('timestamp')
+                value = timestamp.strftime(TIMESTAMP_FORMAT)
+                if current is None or value > current:
+                    cursor['timestamp'] = value
+            if records is not None:
+                cursor['records'] = records
+            if complete is not None:
+                cursor['complete'] = complete
+            self.cursors[device_id] = cursor
+
+    def save(self):
+        """Write the cursors atomically (temp file + rename)."""
+        with self._lock:
+            data = json.dumps(self.cursors, indent=4)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+UNKNOWN = 'Unknown'
+
+
+class EmployeeStatusCache:
+    """In-memory directory of employee statuses fetched from ERPNext.
+
+    Statuses are loaded for a whole batch of employee IDs with one list
+    query per chunk. Active, inactive and unknown (not found) employees are
+    all cached for `ttl` seconds, and the cache is snapshotted to disk so a
+    restarted process starts warm. When a fetch fails, `errors` keeps the
+    exception or error message for each employee it was fetching, until
+    the employee is fetched successfully.
+    """
+
+    def __init__(self, client, ttl=3600, snapshot_file=None, chunk_size=100, logger=None):
+        self.client = client
+        self.ttl = ttl
+        self.snapshot_file = snapshot_file
+        self.chunk_size = chunk_size
+        self.logger = logger or logging.getLogger(__name__)
+        self.entries = {}
+        self.errors = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _fresh(self, employee, now):
+        entry = self.entries.get(employee)
+        return entry is not None and now - entry[1] < self.ttl
+
+    def prefetch(self, employees):
+        """Load the status of every employee not already cached, in bulk.
+
+        Each distinct employee counts as one lookup (hit or miss); read the
+        statuses afterwards with get_status(employee, count=False,
+        fetch=False) so they are not counted twice, and an employee whose
+        fetch failed here is not fetched again for each of its punches.
+        """
+        now = time.time()
+        employees = set(employees)
+        with self._lock:
+            missing = sorted(e for e in employees if not self._fresh(e, now))
+            self.hits += len(employees) - len(missing)
+            self.misses += len(missing)
+        for start in range(0, len(missing), self.chunk_size):
+            self._fetch(missing[start:start + self.chunk_size])
+
+    def _fetch(self, employees):
+        params = {
+            "filters": json.dumps([["employee", "in", employees]]),
+            "fields": '["employee", "status"]',
+            "limit_page_length": len(employees)
+        }
+        try:
+            response = self.client.get(self.client.resource_url("Employee"), params=params)
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Request exception while fetching status for {len(employees)} employees: {e}")
+            self._failed(employees, e)
+            return
+        if response.status_code != 200:
+            self.logger.error(f"Failed to fetch employee statuses: {response.status_code} - {response.text}")
+            self._failed(employees, f"Employee status lookup failed: {response.status_code} - {response.text}"[:1000])
+            return
+        fetched_at = time.time()
+        statuses = {e: UNKNOWN for e in employees}
+        for row in response.json().get('data', []):
+            statuses[row.get('employee')] = row.get('status') or UNKNOWN
+        with self._lock:
+            for employee, status in statuses.items():
+                self.entries[employee] = (status, fetched_at)
+                self.errors.pop(employee, None)
+
+    def _failed(self, employees, error):
+        with self._lock:
+            for employee in employees:
+                self.errors[employee] = error
+
+    def get_status(self, employee, count=True, fetch=True):
+        """Return the cached status, fetching it if missing or expired.
+
+        Returns None when ERPNext could not be reached, or with fetch=False
+        when the status is not cached. With count=False the lookup is left
+        out of the hit/miss counters (see prefetch).
+        """
+        with self._lock:
+            fresh = self._fresh(employee, time.time())
+            if count and fresh:
+                self.hits += 1
+            elif count:
+                self.misses += 1
+        if not fresh and fetch:
+            self._fetch([employee])
+        entry = self.entries.get(employee)
+        return entry[0] if entry else None
+
+    def is_active(self, employee):
+        return self.get_status(employee) == 'Active'
+
+    def load(self):
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Failed to load employee cache {self.snapshot_file}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for employee, (status, fetched_at) in snapshot.items():
+                if now - fetched_at < self.ttl:
+                    self.entries[employee] = (status, fetched_at)
+
+    def save(self):
+        if not self.snapshot_file:
+            return
+        with self._lock:
+            snapshot = {employee: list(entry) for employee, entry in self.entries.items()}
+        tmp_file = self.snapshot_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_file, self.snapshot_file)
+        except OSError as e:
+            self.logger.error(f"Failed to save employee cache {self.snapshot_file}: {e}")
@@ -0,0 +1,111 @@
+import datetime
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import unquote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class ERPNextUnavailable(requests.exceptions.RequestException):
+    """Raised instead of calling ERPNext while its circuit breaker is open."""
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
+
+class ERPNextClient:
+    """Shared HTTP client for the ERPNext REST API.
+
+    Owns one pooled `requests.Session` so every call reuses keep-alive
+    connections instead of opening a new TCP+TLS handshake per request.
+
+    With a `breaker` (circuit_breaker.CircuitBreaker), connection errors,
+    429/5xx responses and responses slower than `slow_threshold` seconds
+    count as failures. While the breaker is open, calls raise
+    ERPNextUnavailable without reaching the server; a 429 or 503 opens it
+    at once for at least the server's Retry-After.
+
+    `on_request`, if given, is called after every request that reached the
+    network with (method, endpoint, status, seconds); endpoint is the URL
+    path without the host and status is 'error' when no response came back.
+    """
+
+    def __init__(self, url, api_key, api_secret, connect_timeout=5, read_timeout=30, pool_size=10, breaker=None, slow_threshold=None, on_request=None):
+        self.url = url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker
+        self.slow_threshold = slow_threshold
+        self.on_request = on_request
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f"token {api_key}:{api_secret}",
+            'Accept': 'application/json'
+        })
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def resource_url(self, doctype):
+        return f"{self.url}/api/resource/{doctype}"
+
+    def method_url(self, method):
+        return f"{self.url}/api/method/{method}"
+
+    def get(self, url, params=None):
+        return self._request('GET', url, params=params)
+
+    def post(self, url, json=None):
+        return self._request('POST', url, json=json)
+
+    def _request(self, method, url, **kwargs):
+        if self.breaker is not None and not self.breaker.allow():
+            raise ERPNextUnavailable(f"ERPNext paused, next attempt in {self.breaker.retry_in():.0f}s")
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            self._observe(method, url, 'error', time.monotonic() - started)
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        elapsed = time.monotonic() - started
+        self._observe(method, url, response.status_code, elapsed)
+        if self.breaker is not None:
+            self._record(response, elapsed)
+        return response
+
+    def _observe(self, method, url, status, elapsed):
+        if self.on_request is None:
+            return
+        endpoint = url[len(self.url):] if url.startswith(self.url) else urlsplit(url).path
+        try:
+            self.on_request(method, unquote(endpoint.split('?')[0]), status, elapsed)
+        except Exception:
+            pass  # metrics must never fail a request
+
+    def _record(self, response, elapsed):
+        status = response.status_code
+        if status in (429, 503):
+            self.breaker.trip(parse_retry_after(response.headers.get('Retry-After')))
+        elif status >= 500:
+            self.breaker.record_failure()
+        elif self.slow_threshold and elapsed > self.slow_threshold:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,60 @@
+import logging
+import threading
+
+from zk import ZK
+
+
+class LiveCaptureWorker(threading.Thread):
+    """Keeps a pyzk live_capture session open to one device.
+
+    Every attendance event is handed to `on_punch(device, attendance)` as
+    soon as the device reports it. `on_connect(device)` is called each time
+    the session is (re)established, before any event, so the caller can
+    poll the device to fill the gap left while it was disconnected. A lost
+    session is retried every `retry_delay` seconds until stop() is called.
+    The session is opened with the device's connection options when a
+    ZKConnectionManager is given as `connections`.
+    """
+
+    def __init__(self, device, on_punch, on_connect, timeout=10, retry_delay=10, logger=None, connections=None):
+        super().__init__(name=f"live-{device['device_id']}", daemon=True)
+        self.device = device
+        self.on_punch = on_punch
+        self.on_connect = on_connect
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.logger = logger or logging.getLogger(__name__)
+        self.connections = connections
+        self.connected = False
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                if self.connections:
+                    zk = self.connections.make_zk(self.device, timeout=self.timeout)
+                else:
+                    zk = ZK(self.device['ip'], timeout=self.timeout)
+                conn = zk.connect()
+                self.connected = True
+                self.on_connect(self.device)
+                for attendance in conn.live_capture(new_timeout=self.timeout):
+                    if self._stopped.is_set():
+                        # let live_capture unregister the event itself
+                        conn.end_live_capture = True
+                    elif attendance is not None:
+                        self.on_punch(self.device, attendance)
+            except Exception as e:
+                self.logger.error(f"Live capture on device {self.device['device_id']} ({self.device['ip']}) lost: {e}")
+            finally:
+                self.connected = False
+                if conn:
+                    try:
+                        conn.disconnect()
+                    except Exception:
+                        pass
+            self._stopped.wait(self.retry_delay)
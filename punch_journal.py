@@ -0,0 +1,72 @@
+import json
+import os
+
+
+def punch_key(punch):
+    return f"{punch.employee}_{punch.time}"
+
+
+class PunchJournal:
+    """Append-only daily journal of punches (one JSON object per line).
+
+    A sidecar file holds the key of every journaled punch so a cycle only
+    has to read the keys, not the whole day, to know what is already
+    stored. The journal line is always written before its key: a crash in
+    between can at worst leave a duplicate line, never lose a punch, and a
+    torn last line is skipped when the journal is read back.
+    """
+
+    def __init__(self, directory, date):
+        self.path = os.path.join(directory, f"biometric_data_{date}.jsonl")
+        self.keys_path = os.path.join(directory, f"biometric_data_{date}.keys")
+        self.seen = None
+
+    def load(self):
+        self.seen = set()
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'r') as f:
+                self.seen.update(line.rstrip('\n') for line in f if line.endswith('\n'))
+        elif os.path.exists(self.path):
+            self.seen.update(f"{log['user_id']}_{log['timestamp']}" for log in self.read())
+            self._write_keys(self.seen, 'w')
+
+    def read(self):
+        """Yield every punch in the journal as a dict, skipping a torn last line."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def append(self, punches):
+        """Append the punches not journaled yet and return them."""
+        if self.seen is None:
+            self.load()
+        new_punches = {}
+        for punch in punches:
+            key = punch_key(punch)
+            if key not in self.seen:
+                new_punches.setdefault(key, punch)
+        if not new_punches:
+            return []
+        with open(self.path, 'a+b') as f:
+            if f.tell() and not self._ends_with_newline(f):
+                f.write(b'\n')
+            f.writelines((json.dumps(punch.to_dict()) + '\n').encode() for punch in new_punches.values())
+            f.flush()
+            os.fsync(f.fileno())
+        self._write_keys(new_punches, 'a')
+        self.seen.update(new_punches)
+        return list(new_punches.values())
+
+    @staticmethod
+    def _ends_with_newline(f):
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+    def _write_keys(self, keys, mode):
+        with open(self.keys_path, mode) as f:
+            f.writelines(key + '\n' for key in keys)
@@ -0,0 +1,120 @@
+import datetime
+import sqlite3
+
+from punches import Punch
+
+PENDING = 'pending'
+SENT = 'sent'
+DUPLICATE = 'duplicate'
+INACTIVE = 'inactive'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    log_type TEXT,
+    device_id TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    erpnext_name TEXT,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    UNIQUE (employee, timestamp)
+);
+CREATE INDEX IF NOT EXISTS punches_state ON punches (state, id);
+"""
+
+
+class PunchOutbox:
+    """SQLite outbox holding every normalized punch and its delivery state.
+
+    Punches are queued as 'pending' and move to 'sent', 'duplicate',
+    'inactive' or 'failed' once pushed. A failed push stays pending until
+    it has been attempted `max_attempts` times. The (employee, timestamp)
+    unique index makes queueing the same punch twice a no-op. Every
+    commit is durable once it returns.
+    """
+
+    def __init__(self, path, max_attempts=5):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # FULL: a committed add() must survive a power loss, because the
+        # device cursors are advanced (and fsynced) right after it
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.executescript(SCHEMA)
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def add(self, punches):
+        """Queue punches as pending; returns how many were not queued before."""
+        now = self._now()
+        with self.db:
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO punches (employee, timestamp, log_type, device_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(punch.employee, punch.timestamp, punch.log_type, punch.device_id, now, now) for punch in punches]
+            )
+            return self.db.total_changes - before
+
+    def last_id(self):
+        return self.db.execute("SELECT COALESCE(MAX(id), 0) FROM punches").fetchone()[0]
+
+    def iter_pending(self, batch_size, after_id=0, last_id=None):
+        """Yield the pending punches with after_id < id <= last_id in batches,
+        oldest first (last_id defaults to the newest row right now).
+
+        Rows queued or sent back to pending while iterating are left for the
+        next call, so a failing punch is only attempted once per drain.
+        """
+        if last_id is None:
+            last_id = self.last_id()
+        while True:
+            rows = self.db.execute(
+                "SELECT * FROM punches WHERE state = ? AND id > ? AND id <= ? ORDER BY id LIMIT ?",
+                (PENDING, after_id, last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            after_id = rows[-1]['id']
+            yield [Punch.from_fields(row['employee'], row['timestamp'], row['device_id'], row['log_type']) for row in rows]
+
+    def mark(self, punches, state, details=None):
+        """Record the outcome of one push attempt for the given punches.
+
+        `details` holds one value per punch: the ERPNext document name for
+        sent punches, the error message otherwise.
+        """
+        now = self._now()
+        details = details or [None] * len(punches)
+        if state == FAILED:
+            sql = ("UPDATE punches SET attempts = attempts + 1, last_error = ?, updated_at = ?, "
+                   "state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END WHERE employee = ? AND timestamp = ?")
+            params = [(detail, now, self.max_attempts, *punch.key) for punch, detail in zip(punches, details)]
+        elif state == SENT:
+            sql = "UPDATE punches SET attempts = attempts + 1, state = ?, erpnext_name = ?, last_error = NULL, updated_at = ? WHERE employee = ? AND timestamp = ?"
+            params = [(state, detail, now, *punch.key) for punch, detail in zip(punches, details)]
+        else:
+            sql = "UPDATE punches SET attempts = attempts + 1, state = ?, last_error = ?, updated_at = ? WHERE employee = ? AND timestamp = ?"
+            params = [(state, detail, now, *punch.key) for punch, detail in zip(punches, details)]
+        with self.db:
+            self.db.executemany(sql, params)
+
+    def unsettled(self, device_id):
+        """Number of punches from the device not yet settled (pending or failed)."""
+        return self.db.execute(
+            "SELECT COUNT(*) FROM punches WHERE device_id = ? AND state IN (?, ?)", (device_id, PENDING, FAILED)
+        ).fetchone()[0]
+
+    def counts(self):
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM punches GROUP BY state").fetchall())
+
+    def close(self):
+        self.db.close()
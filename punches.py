@@ -0,0 +1,117 @@
+import calendar
+import datetime
+import sys
+import time
+from collections import namedtuple
+from enum import IntEnum
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_employee_ids = {}
+
+
+class Direction(IntEnum):
+    IN = 0
+    OUT = 1
+
+    @classmethod
+    def for_hour(cls, hour):
+        return cls.IN if 8 <= hour < 17 else cls.OUT
+
+
+def employee_id(user_id):
+    """Map a device user_id to the interned ERPNext employee ID (T000039)."""
+    employee = _employee_ids.get(user_id)
+    if employee is None:
+        employee = _employee_ids[user_id] = sys.intern(f"T{int(user_id):06d}")
+    return employee
+
+
+def to_epoch(value):
+    """Device-local datetime (or 'YYYY-mm-dd HH:MM:SS' string) to integer seconds.
+
+    Device clocks carry no timezone, so the wall-clock value is encoded as
+    if it were UTC and round-trips unchanged through format_timestamp.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value[:19])
+    return calendar.timegm(value.timetuple())
+
+
+def format_timestamp(epoch):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch))
+
+
+def to_datetime(epoch):
+    return datetime.datetime(*time.gmtime(epoch)[:6])
+
+
+class Punch(namedtuple('Punch', 'employee timestamp device_id direction')):
+    """One attendance punch as it moves from device fetch to ERPNext push.
+
+    A plain tuple (no per-instance dict): the interned employee ID, the
+    punch time as integer epoch seconds, the device_id and a Direction.
+    Strings are only produced at the ERPNext/JSON boundary through `time`,
+    `log_type` and `to_dict`.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_attendance(cls, attendance, device_id):
+        timestamp = to_epoch(attendance.timestamp)
+        return cls(employee_id(attendance.user_id), timestamp, device_id, Direction.for_hour(attendance.timestamp.hour))
+
+    @classmethod
+    def from_fields(cls, employee, timestamp, device_id, log_type):
+        return cls(sys.intern(employee), timestamp, device_id, Direction[log_type])
+
+    @property
+    def key(self):
+        """Identity of the punch in ERPNext: one checkin per employee and second."""
+        return (self.employee, self.timestamp)
+
+    @property
+    def time(self):
+        return format_timestamp(self.timestamp)
+
+    @property
+    def log_type(self):
+        return self.direction.name
+
+    def to_dict(self):
+        return {
+            'user_id': self.employee,
+            'timestamp': self.time,
+            'punch_direction': self.log_type,
+            'log_type': self.log_type,
+            'device_id': self.device_id
+        }
+
+
+def iter_new_punches(punches, seen_keys):
+    """Yield the punches whose (employee, timestamp, device_id) is not in
+    `seen_keys`, adding them to it. Membership is checked against a hash
+    set, so this is linear in the number of punches.
+    """
+    for punch in punches:
+        if punch not in seen_keys:
+            seen_keys.add(punch)
+            yield punch
+
+
+def select_new_logs(logs, seen_keys=None):
+    """Return the new punches among `logs`, the punches of every device in
+    the cycle (see iter_new_punches)."""
+    return list(iter_new_punches(logs, seen_keys if seen_keys is not None else set()))
+
+
+def batched(iterable, size):
+    """Yield lists of at most `size` items from `iterable`."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` acquisitions per second on average,
+    with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _push_all(items, send, concurrency, rate, on_done):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate) if rate else None
+    completed = 0
+
+    async def push(item):
+        nonlocal completed
+        async with semaphore:
+            if bucket:
+                await bucket.acquire()
+            result = await loop.run_in_executor(executor, send, item)
+        completed += 1
+        if on_done:
+            on_done(completed, len(items))
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='erpnext-push') as executor:
+        return await asyncio.gather(*(push(item) for item in items))
+
+
+def push_concurrently(items, send, concurrency=4, rate=None, on_done=None):
+    """Call the blocking `send(item)` for every item with at most
+    `concurrency` calls in flight and at most `rate` calls started per
+    second (no limit when rate is falsy).
+
+    Returns the results in the same order as `items`. `on_done(completed,
+    total)` is called after each item finishes, e.g. to report progress.
+    """
+    items = list(items)
+    if not items:
+        return []
+    return asyncio.run(_push_all(items, send, max(1, concurrency), rate, on_done))
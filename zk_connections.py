@@ -0,0 +1,81 @@
+import threading
+
+from zk import ZK
+
+
+class ZKConnectionManager:
+    """Keeps one pyzk session per device open across sync cycles.
+
+    Per-device options come from the device config and fall back to the
+    manager defaults: 'port', 'password', 'timeout', 'force_udp' (use UDP
+    instead of TCP) and 'ommit_ping' (skip pyzk's ICMP ping subprocess
+    before connecting).
+
+    No extra packet is spent on health checks: the first command run on a
+    reused session doubles as the liveness check, and if it fails the
+    session is replaced by a fresh one and the call is run once more.
+    """
+
+    def __init__(self, timeout=60, force_udp=False, ommit_ping=False):
+        self.timeout = timeout
+        self.force_udp = force_udp
+        self.ommit_ping = ommit_ping
+        self.sessions = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def make_zk(self, device, timeout=None):
+        return ZK(
+            device['ip'],
+            port=device.get('port', 4370),
+            timeout=timeout or device.get('timeout', self.timeout),
+            password=device.get('password', 0),
+            force_udp=device.get('force_udp', self.force_udp),
+            ommit_ping=device.get('ommit_ping', self.ommit_ping)
+        )
+
+    def _lock(self, device_id):
+        with self._locks_lock:
+            return self._locks.setdefault(device_id, threading.Lock())
+
+    def run(self, device, fn):
+        """Call fn(conn) on the device's session and return its result.
+
+        Only one call per device runs at a time. An error on a freshly
+        opened session is raised as is and the session is dropped.
+        """
+        device_id = device['device_id']
+        with self._lock(device_id):
+            conn = self.sessions.get(device_id)
+            reused = conn is not None and conn.is_connect
+            if not reused:
+                self._drop(device_id)
+                conn = self.sessions[device_id] = self.make_zk(device).connect()
+            try:
+                return fn(conn)
+            except Exception:
+                self._drop(device_id)
+                if not reused:
+                    raise
+            conn = self.sessions[device_id] = self.make_zk(device).connect()
+            try:
+                return fn(conn)
+            except Exception:
+                self._drop(device_id)
+                raise
+
+    def _drop(self, device_id):
+        conn = self.sessions.pop(device_id, None)
+        if conn is not None:
+            try:
+                conn.disconnect()
+            except Exception:
+                pass
+
+    def discard(self, device_id):
+        with self._lock(device_id):
+            self._drop(device_id)
+
+    def close_all(self):
+        for device_id in list(self.sessions):
+            self.discard(device_id)
@@ -0,0 +1,76 @@
+from struct import pack, unpack
+
+from zk import const
+from zk.attendance import Attendance
+
+# pyzk keeps its protocol helpers name-mangled; the tail read reuses them
+# so the packets on the wire are exactly the ones get_attendance sends.
+CMD_PREPARE_BUFFER = 1503
+RECORD_SIZES = (8, 16, 40)
+
+
+def get_attendance_tail(conn, known_records):
+    """Download only the attendance records after the first `known_records`.
+
+    conn.read_sizes() must have been called so conn.records is current.
+    The device prepares its attendance buffer as usual, but only the bytes
+    from record `known_records` onwards are read back. Returns the new
+    Attendance objects and the number of records in the buffer, or None
+    when the tail cannot be read this way (inline reply, unknown record
+    layout, device cleared) and the caller should fall back to
+    conn.get_attendance().
+    """
+    records = conn.records
+    if records < known_records:
+        return None
+    if records == known_records:
+        return [], records
+
+    command_string = pack('<bhii', 1, const.CMD_ATTLOG_RRQ, 0, 0)
+    cmd_response = conn._ZK__send_command(CMD_PREPARE_BUFFER, command_string, 1024)
+    if not cmd_response.get('status') or cmd_response['code'] == const.CMD_DATA:
+        return None
+    size = unpack('I', conn._ZK__data[1:5])[0]
+    record_size, remainder = divmod(size - 4, records)
+    if remainder or record_size not in RECORD_SIZES:
+        conn.free_data()
+        return None
+
+    max_chunk = 0xFFc0 if conn.tcp else 16 * 1024
+    start = 4 + known_records * record_size
+    data = []
+    while start < size:
+        chunk_size = min(max_chunk, size - start)
+        data.append(conn._ZK__read_chunk(start, chunk_size))
+        start += chunk_size
+    conn.free_data()
+
+    users = conn.get_users() if record_size in (8, 16) else []
+    return _decode_records(conn, b''.join(data), record_size, users), records
+
+
+def _decode_records(conn, attendance_data, record_size, users):
+    """Decode raw attendance records the same way pyzk's get_attendance does."""
+    decode_time = conn._ZK__decode_time
+    users_by_uid = {user.uid: user for user in users}
+    users_by_user_id = {user.user_id: user for user in users}
+    attendances = []
+    for offset in range(0, len(attendance_data) - record_size + 1, record_size):
+        record = attendance_data[offset:offset + record_size]
+        if record_size == 8:
+            uid, status, timestamp, punch = unpack('HB4sB', record)
+            user = users_by_uid.get(uid)
+            user_id = user.user_id if user else str(uid)
+        elif record_size == 16:
+            user_id, timestamp, status, punch, _reserved, _workcode = unpack('<I4sBB2sI', record)
+            user_id = str(user_id)
+            user = users_by_user_id.get(user_id) or users_by_uid.get(user_id)
+            if user:
+                uid, user_id = user.uid, user.user_id
+            else:
+                uid = user_id
+        else:
+            uid, user_id, status, timestamp, punch, _space = unpack('<H24sB4sB8s', record)
+            user_id = (user_id.split(b'\x00')[0]).decode(errors='ignore')
+        attendances.append(Attendance(user_id, decode_time(timestamp), status, punch, uid))
+    return attendances